@@ -1,23 +1,51 @@
+import functools
 import logging
 import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 import boto3
+from boto3.dynamodb.conditions import Attr
 from boto3.dynamodb.types import TypeDeserializer
+from botocore.config import Config
+from botocore.exceptions import ClientError
 
 
 LOGGER = logging.getLogger()
 
-DDB_PARTIQL = "SELECT * FROM {} WHERE glue_job_created = False AND data_catalog_entry = False AND data_source_type = 's3'"
+DDB_FILTER = (
+    Attr("glue_job_created").eq(False)
+    & Attr("data_catalog_entry").eq(False)
+    & Attr("data_source_type").eq("s3")
+)
+# only the attributes the handler reads are returned by the scan
+DDB_PROJECTION = "id, data_source_attrs.bucketName"
 
 GLUE_TRACKER_DDB_TABLE_NAME_ENV_VAR = "DDB_GLUE_TRACKER_TABLE_NAME"
 DATA_CATALOG_DB_NAME_ENV_VAR = "DATA_CATALOG_DB_NAME"
 
 GLUE_ROLE_ARN_ENV_VAR = "GLUE_ROLE_ARN"
 
+# glue data catalog only likes _ as special characters
+CATALOG_NAME_TABLE = str.maketrans({"-": "_", ".": "_"})
+
+# upper bound on concurrent S3 sources processed per invocation
+MAX_WORKERS = 16
+
+# the per-source crawler workers and the tracker updates share these
+# pooled connections
+BOTO_CONFIG = Config(
+    tcp_keepalive=True,
+    max_pool_connections=50,
+    retries={"mode": "standard", "max_attempts": 3},
+)
+
+# converts the DynamoDB Streams images into python objects
+DESERIALIZER = TypeDeserializer()
+
+DDB_CLIENT = boto3.client("dynamodb", config=BOTO_CONFIG)
+DDB_RESOURCE = boto3.resource("dynamodb", config=BOTO_CONFIG)
+GLUE_CLIENT = boto3.client("glue", config=BOTO_CONFIG)
 
-class MalformedEvent(Exception):
-    """Raised if a malformed event received"""
-    
 
 class MissingEnvironmentVariable(Exception):
     """Raised if a required environment variable is missing"""
@@ -47,73 +75,88 @@ def _configure_logger():
         logging.basicConfig(level=level)
 
 
-def _check_missing_field(validation_dict, extraction_key):
-    """Check if a field exists in a dictionary
+# logging and environment only need to be set up once per execution environment
+_configure_logger()
+_silence_noisy_loggers()
+
+GLUE_TRACKER_DDB_TABLE_NAME = os.environ.get(GLUE_TRACKER_DDB_TABLE_NAME_ENV_VAR)
+if not GLUE_TRACKER_DDB_TABLE_NAME:
+    raise MissingEnvironmentVariable(f"{GLUE_TRACKER_DDB_TABLE_NAME_ENV_VAR} is missing")
+
+GLUE_ROLE_ARN = os.environ.get(GLUE_ROLE_ARN_ENV_VAR)
+if not GLUE_ROLE_ARN:
+    raise MissingEnvironmentVariable(f"{GLUE_ROLE_ARN_ENV_VAR} is missing")
 
-    :param validation_dict: Dictionary
-    :param extraction_key: String
+DATA_CATALOG_DB_NAME = os.environ.get(DATA_CATALOG_DB_NAME_ENV_VAR)
+if not DATA_CATALOG_DB_NAME:
+    raise MissingEnvironmentVariable(f"{DATA_CATALOG_DB_NAME_ENV_VAR} is missing")
 
-    :raises: MalformedEvent
+
+@functools.lru_cache(maxsize=1)
+def _get_account_id_from_sts():
+    """Fetch the account id via STS (cached, it never changes for a given function)
+
+    :rtype: String
     """
-    extracted_value = validation_dict.get(extraction_key)
-    
-    if not extracted_value:
-        LOGGER.error(f"Missing '{extraction_key}' field in the event")
-        raise MalformedEvent
-    
+    return boto3.client("sts", config=BOTO_CONFIG).get_caller_identity()["Account"]
 
-def _validate_field(validation_dict, extraction_key, expected_value):
-    """Validate the passed in field
 
-    :param validation_dict: Dictionary
-    :param extraction_key: String
-    :param expected_value: String
+def _get_account_id(context):
+    """Return the account id the function is running in
 
-    :raises: ValueError
+    The invoked function ARN already carries the account id, so STS is
+    only called when no Lambda context is available (e.g. local testing).
+
+    :param context: Lambda context object
+
+    :rtype: String
     """
-    extracted_value = validation_dict.get(extraction_key)
+    if context is None:
+        return _get_account_id_from_sts()
+    return context.invoked_function_arn.split(":")[4]
 
-    _check_missing_field(validation_dict, extraction_key)
-    
-    if extracted_value != expected_value:
-        LOGGER.error(f"Incorrect value found for '{extraction_key}' field")
-        raise ValueError
-    
 
-def _fetch_ddb_results(client, query):
-    """Fetch results from PartiQL DynamoDB query
+def _fetch_ddb_results(table, filter_expression, projection_expression):
+    """Scan a DynamoDB table for the items matching the filter
 
-    :param client: Boto3 client (DynamoDB)
-    :param query: String
+    :param table: Boto3 resource object (DynamoDB Table)
+    :param filter_expression: boto3.dynamodb.conditions.ConditionBase
+    :param projection_expression: String
 
-    :rtype: Dictionary
+    :rtype: List
     """
-    resp = client.execute_statement(Statement=query)
+    items = []
+    scan_kwargs = {
+        "FilterExpression": filter_expression,
+        "ProjectionExpression": projection_expression,
+    }
 
-    _check_missing_field(resp, "ResponseMetadata")
+    while True:
+        resp = table.scan(**scan_kwargs)
 
-    _validate_field(resp["ResponseMetadata"], "HTTPStatusCode", 200)
+        items.extend(resp.get("Items", []))
 
-    return resp
+        # scans return at most 1MB per page
+        last_evaluated_key = resp.get("LastEvaluatedKey")
+        if not last_evaluated_key:
+            return items
+        scan_kwargs["ExclusiveStartKey"] = last_evaluated_key
 
 
-def unmarshall_ddb_items(ddb_items):
-    """Deserialize ddb_items
+def _fetch_stream_results(records):
+    """Deserialize the new images of the DynamoDB Streams records
 
-    :param ddb_items: List
+    The event source mapping already filters the stream down to newly
+    inserted S3 sources without a data catalog entry.
+
+    :param records: List
 
     :rtype: List
     """
-    unmarshalled = []
-
-    deserializer = TypeDeserializer()
-
-    for ddb_item in ddb_items:
-        unmarshalled.append(
-            {k: deserializer.deserialize(v) for k, v in ddb_item.items()}
-        )
-    
-    return unmarshalled
+    return [
+        {k: DESERIALIZER.deserialize(v) for k, v in record["dynamodb"]["NewImage"].items()}
+        for record in records
+    ]
 
 
 def update_ddb(client, table_name, obj, dc_table_name, dc_db_name):
@@ -125,7 +168,7 @@ def update_ddb(client, table_name, obj, dc_table_name, dc_db_name):
     :param dc_table_name: String
     :param dc_db_name: String
     """
-    resp = client.update_item(
+    client.update_item(
         TableName=table_name,
         Key={"id": {"S": obj["id"]}},
         UpdateExpression="SET #data_catalog_entry = :true, #data_catalog_table_name =:t, #data_catalog_db_name =:d",
@@ -140,8 +183,6 @@ def update_ddb(client, table_name, obj, dc_table_name, dc_db_name):
             ":d": {"S": dc_db_name},
         }
     )
-    _check_missing_field(resp, "ResponseMetadata")
-    _validate_field(resp["ResponseMetadata"], "HTTPStatusCode", 200)
     LOGGER.info("Successfully updated DynamoDB item")
 
 
@@ -154,19 +195,23 @@ def create_data_catalog_table(client, bucket_name, data_catalog_db_name, account
     :param account_id: String
     :param table_name: String
     """
-    LOGGER.info(f"Attempting to create table: {table_name} in DB: {data_catalog_db_name}")
-    resp = client.create_table(
-        CatalogId=account_id,
-        DatabaseName=data_catalog_db_name,
-        TableInput={
-            "Name": table_name,
-            "StorageDescriptor": {
-                "Location": f"s3://{bucket_name}/"
+    LOGGER.info("Attempting to create table: %s in DB: %s", table_name, data_catalog_db_name)
+    try:
+        client.create_table(
+            CatalogId=account_id,
+            DatabaseName=data_catalog_db_name,
+            TableInput={
+                "Name": table_name,
+                "StorageDescriptor": {
+                    "Location": f"s3://{bucket_name}/"
+                }
             }
-        }
-    )
-    _check_missing_field(resp, "ResponseMetadata")
-    _validate_field(resp["ResponseMetadata"], "HTTPStatusCode", 200)
+        )
+    except ClientError as e:
+        # left behind by an earlier attempt whose tracker update never landed
+        if e.response["Error"]["Code"] != "AlreadyExistsException":
+            raise e
+        LOGGER.warning("Table %s already exists", table_name)
 
 
 def create_crawler(client, data_catalog_db_name, table_name, role_arn):
@@ -178,106 +223,112 @@ def create_crawler(client, data_catalog_db_name, table_name, role_arn):
     :param role_arn: String
     """
     crawler_name = f"{table_name}_crawler"
-    LOGGER.info(f"Attempting to create crawler: {table_name}")
-    resp = client.create_crawler(
-        Name=crawler_name,
-        Role=role_arn,
-        DatabaseName=data_catalog_db_name,
-        Targets={
-        'CatalogTargets': [
-            {
-                'DatabaseName': data_catalog_db_name,
-                'Tables': [
-                    table_name,
-                ],
+    LOGGER.info("Attempting to create crawler: %s", table_name)
+    try:
+        client.create_crawler(
+            Name=crawler_name,
+            Role=role_arn,
+            DatabaseName=data_catalog_db_name,
+            Targets={
+            'CatalogTargets': [
+                {
+                    'DatabaseName': data_catalog_db_name,
+                    'Tables': [
+                        table_name,
+                    ],
+                },
+            ],
             },
-        ],
-        },
-         SchemaChangePolicy={
-        'UpdateBehavior': 'UPDATE_IN_DATABASE',
-        'DeleteBehavior': 'LOG'},
-        Schedule='cron(0 2 * * ? *)',
-        )
-    _check_missing_field(resp, "ResponseMetadata")
-    _validate_field(resp["ResponseMetadata"], "HTTPStatusCode", 200)
+             SchemaChangePolicy={
+            'UpdateBehavior': 'UPDATE_IN_DATABASE',
+            'DeleteBehavior': 'LOG'},
+            Schedule='cron(0 2 * * ? *)',
+            )
+    except ClientError as e:
+        # left behind by an earlier attempt whose tracker update never landed
+        if e.response["Error"]["Code"] != "AlreadyExistsException":
+            raise e
+        LOGGER.warning("Crawler %s already exists", crawler_name)
 
 
-def lambda_handler(event, context):
-    """What executes when the program is run"""
-    
-    # configure python logger
-    _configure_logger()
-    # silence chatty libraries
-    _silence_noisy_loggers()
-
-    ddb_table_name = os.environ.get(GLUE_TRACKER_DDB_TABLE_NAME_ENV_VAR)
-    if not ddb_table_name:
-        raise MissingEnvironmentVariable(f"{GLUE_TRACKER_DDB_TABLE_NAME_ENV_VAR} is missing")
-    
-    ddb_client = boto3.client("dynamodb")
+def _process_source(s3_obj, ddb_table_name, data_catalog_db_name, account_id, role_arn):
+    """Create the data catalog table and crawler for an S3 source
 
-    ddb_resp = _fetch_ddb_results(
-        ddb_client, 
-        DDB_PARTIQL.format(ddb_table_name),
+    :param s3_obj: Dictionary
+    :param ddb_table_name: String
+    :param data_catalog_db_name: String
+    :param account_id: String
+    :param role_arn: String
+    """
+    bucket_name = s3_obj["data_source_attrs"]["bucketName"]
+    catalog_bucket_name = bucket_name.translate(CATALOG_NAME_TABLE)
+    dc_table_name = f"{data_catalog_db_name}_{catalog_bucket_name}"
+    
+    create_data_catalog_table(
+        client=GLUE_CLIENT,
+        bucket_name=bucket_name,
+        data_catalog_db_name=data_catalog_db_name,
+        account_id=account_id,
+        table_name=dc_table_name
     )
+    LOGGER.info("Successfully created data catalog table")
 
-    ddb_results = ddb_resp.get("Items")
-    if not ddb_results:
-        LOGGER.warning("No data sources returned. Exiting.")
-        return
-
-    pythonic_results = unmarshall_ddb_items(ddb_results)
-    
-    role_arn = os.environ.get(GLUE_ROLE_ARN_ENV_VAR)
-    if not role_arn:
-        raise MissingEnvironmentVariable(f"{GLUE_ROLE_ARN_ENV_VAR} is missing")
-    
-    data_catalog_db_name = os.environ.get(DATA_CATALOG_DB_NAME_ENV_VAR)
-    if not data_catalog_db_name:
-        raise MissingEnvironmentVariable(f"{DATA_CATALOG_DB_NAME_ENV_VAR} is missing")
+    create_crawler(
+        client=GLUE_CLIENT,
+        data_catalog_db_name=data_catalog_db_name,
+        table_name=dc_table_name,
+        role_arn=role_arn
+    )
+    LOGGER.info("Successfully created crawler")
     
-    # need account id for catalog table creation
-    account_id = boto3.client("sts").get_caller_identity()["Account"]
- 
-    glue_client = boto3.client("glue")
-
-    for s3_obj in pythonic_results:
-        bucket_name = s3_obj["data_source_attrs"]["bucketName"]
-        # glue data catalog only likes _ as special characters
-        catalog_bucket_name = bucket_name.replace("-", "_")
-        catalog_bucket_name = catalog_bucket_name.replace(".", "_")
-        dc_table_name = f"{data_catalog_db_name}_{catalog_bucket_name}"
-        
-        create_data_catalog_table(
-            client=glue_client,
-            bucket_name=bucket_name,
-            data_catalog_db_name=data_catalog_db_name,
-            account_id=account_id,
-            table_name=dc_table_name
+    update_ddb(
+        client=DDB_CLIENT,
+        table_name=ddb_table_name,
+        obj=s3_obj,
+        dc_table_name=dc_table_name,
+        dc_db_name=data_catalog_db_name
+    )
 
-        )
-        LOGGER.info("Successfully created data catalog table")
-
-        create_crawler(
-            client=glue_client,
-            data_catalog_db_name=data_catalog_db_name,
-            table_name=dc_table_name,
-            role_arn=role_arn
-        )
-        LOGGER.info("Successfully created crawler")
-        
-        LOGGER.info("Attempting to update glue job tracker table")
-        update_ddb(
-                client=ddb_client,
-                obj=s3_obj,
-                table_name=ddb_table_name,
-                dc_table_name=dc_table_name,
-                dc_db_name=data_catalog_db_name
-            )
 
+def lambda_handler(event, context):
+    """What executes when the program is run"""
 
-    LOGGER.debug("Closing DynamoDB Boto3 client") 
-    ddb_client.close()
+    if event and event.get("Records"):
+        pythonic_results = _fetch_stream_results(event["Records"])
+    else:
+        # invoked without stream records (e.g. manual backfill), fall back to a scan
+        pythonic_results = _fetch_ddb_results(
+            DDB_RESOURCE.Table(GLUE_TRACKER_DDB_TABLE_NAME),
+            DDB_FILTER,
+            DDB_PROJECTION,
+        )
+    if not pythonic_results:
+        LOGGER.warning("No data sources returned. Exiting.")
+        return
 
-    LOGGER.debug("Closing Glue boto3 client")
-    glue_client.close()
+    # need account id for catalog table creation
+    account_id = _get_account_id(context)
+
+    process_source = functools.partial(
+        _process_source,
+        ddb_table_name=GLUE_TRACKER_DDB_TABLE_NAME,
+        data_catalog_db_name=DATA_CATALOG_DB_NAME,
+        account_id=account_id,
+        role_arn=GLUE_ROLE_ARN,
+    )
+    # Glue and DynamoDB calls are network bound, so the sources are processed concurrently
+    max_workers = min(MAX_WORKERS, len(pythonic_results))
+    errors = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(process_source, obj): obj for obj in pythonic_results}
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except Exception as e:
+                LOGGER.error("Unable to process S3 source: %s", futures[future]["id"], exc_info=e)
+                errors.append(e)
+
+    # each source records its own tracker entry, so the ones that succeeded
+    # stay recorded and a retry only has to redo the failed ones
+    if errors:
+        raise errors[0]
@@ -1,25 +1,45 @@
 import datetime
+import functools
 import logging
 import os
-import uuid
+from concurrent.futures import ThreadPoolExecutor
 
 import boto3
-from boto3.dynamodb.types import TypeDeserializer, TypeSerializer
+from boto3.dynamodb.conditions import Attr
+from botocore.config import Config
 
 
 LOGGER = logging.getLogger()
 
-DDB_PARTIQL = "SELECT * FROM {} WHERE data_catalog_entry = True AND data_source_type = 'dynamodb'"
+DDB_FILTER = (
+    Attr("data_catalog_entry").eq(True)
+    & Attr("data_source_type").eq("dynamodb")
+)
+# only the attributes the handler reads are returned by the scan
+DDB_PROJECTION = (
+    "data_catalog_table_name, "
+    "data_source_attrs.tableDescription.tableName, "
+    "data_source_attrs.tableDescription.tableArn"
+)
 
 GLUE_TRACKER_DDB_TABLE_NAME_ENV_VAR = "DDB_GLUE_TRACKER_TABLE_NAME"
 DDB_TAG_TABLE_NAME_ENV_VAR = "TAG_REPORT_TABLE_NAME"
 
-REQUIRED_TAG_KEYS = ["APP_ID", "Purpose of Processing", "Data Subjects", "APP_NAME", "Business Function", "Processing Activity"]
+# upper bound on concurrent tag lookups per invocation
+MAX_WORKERS = 16
 
+REQUIRED_TAG_KEYS = frozenset({"APP_ID", "Purpose of Processing", "Data Subjects", "APP_NAME", "Business Function", "Processing Activity"})
+
+# the per-table tagging workers share these pooled connections
+BOTO_CONFIG = Config(
+    tcp_keepalive=True,
+    max_pool_connections=50,
+    retries={"mode": "standard", "max_attempts": 3},
+)
+
+DDB_CLIENT = boto3.client("dynamodb", config=BOTO_CONFIG)
+DDB_RESOURCE = boto3.resource("dynamodb", config=BOTO_CONFIG)
 
-class MalformedEvent(Exception):
-    """Raised if a malformed event received"""
-    
 
 class MissingEnvironmentVariable(Exception):
     """Raised if a required environment variable is missing"""
@@ -49,73 +69,44 @@ def _configure_logger():
         logging.basicConfig(level=level)
 
 
-def _check_missing_field(validation_dict, extraction_key):
-    """Check if a field exists in a dictionary
-
-    :param validation_dict: Dictionary
-    :param extraction_key: String
-
-    :raises: MalformedEvent
-    """
-    extracted_value = validation_dict.get(extraction_key)
-    
-    if not extracted_value:
-        LOGGER.error(f"Missing '{extraction_key}' field in the event")
-        raise MalformedEvent
-    
-
-def _validate_field(validation_dict, extraction_key, expected_value):
-    """Validate the passed in field
+# logging and environment only need to be set up once per execution environment
+_configure_logger()
+_silence_noisy_loggers()
 
-    :param validation_dict: Dictionary
-    :param extraction_key: String
-    :param expected_value: String
+GLUE_TRACKER_DDB_TABLE_NAME = os.environ.get(GLUE_TRACKER_DDB_TABLE_NAME_ENV_VAR)
+if not GLUE_TRACKER_DDB_TABLE_NAME:
+    raise MissingEnvironmentVariable(f"{GLUE_TRACKER_DDB_TABLE_NAME_ENV_VAR} is missing")
 
-    :raises: ValueError
-    """
-    extracted_value = validation_dict.get(extraction_key)
+DDB_TAG_TABLE_NAME = os.environ.get(DDB_TAG_TABLE_NAME_ENV_VAR)
+if not DDB_TAG_TABLE_NAME:
+    raise MissingEnvironmentVariable(f"{DDB_TAG_TABLE_NAME_ENV_VAR} is missing")
 
-    _check_missing_field(validation_dict, extraction_key)
-    
-    if extracted_value != expected_value:
-        LOGGER.error(f"Incorrect value found for '{extraction_key}' field")
-        raise ValueError
-    
 
-def _fetch_ddb_results(client, query):
-    """Fetch results from PartiQL DynamoDB query
+def _fetch_ddb_results(table, filter_expression, projection_expression):
+    """Scan a DynamoDB table for the items matching the filter
 
-    :param client: Boto3 client (DynamoDB)
-    :param query: String
+    :param table: Boto3 resource object (DynamoDB Table)
+    :param filter_expression: boto3.dynamodb.conditions.ConditionBase
+    :param projection_expression: String
 
     :rtype: List
     """
-    resp = client.execute_statement(Statement=query)
-
-    _check_missing_field(resp, "ResponseMetadata")
-
-    _validate_field(resp["ResponseMetadata"], "HTTPStatusCode", 200)
+    items = []
+    scan_kwargs = {
+        "FilterExpression": filter_expression,
+        "ProjectionExpression": projection_expression,
+    }
 
-    return resp
+    while True:
+        resp = table.scan(**scan_kwargs)
 
+        items.extend(resp.get("Items", []))
 
-def unmarshall_ddb_items(ddb_items):
-    """Deserialize ddb_items
-
-    :param ddb_items: List
-
-    :rtype: List
-    """
-    unmarshalled = []
-
-    deserializer = TypeDeserializer()
-
-    for ddb_item in ddb_items:
-        unmarshalled.append(
-            {k: deserializer.deserialize(v) for k, v in ddb_item.items()}
-        )
-    
-    return unmarshalled
+        # scans return at most 1MB per page
+        last_evaluated_key = resp.get("LastEvaluatedKey")
+        if not last_evaluated_key:
+            return items
+        scan_kwargs["ExclusiveStartKey"] = last_evaluated_key
 
 
 def get_table_tags(client, table_arn):
@@ -127,8 +118,6 @@ def get_table_tags(client, table_arn):
     :rtype: List
     """
     resp = client.list_tags_of_resource(ResourceArn=table_arn)
-    _check_missing_field(resp, "ResponseMetadata")
-    _validate_field(resp["ResponseMetadata"], "HTTPStatusCode", 200)
     
     tags = resp.get("Tags")
     if not tags:
@@ -140,72 +129,54 @@ def get_table_tags(client, table_arn):
 
 def lambda_handler(event, context):
     """What executes when the program is run"""
-    
-    # configure python logger
-    _configure_logger()
-    # silence chatty libraries
-    _silence_noisy_loggers()
-
-    ddb_table_name = os.environ.get(GLUE_TRACKER_DDB_TABLE_NAME_ENV_VAR)
-    if not ddb_table_name:
-        raise MissingEnvironmentVariable(f"{GLUE_TRACKER_DDB_TABLE_NAME_ENV_VAR} is missing")
-    
-    tag_table_name = os.environ.get(DDB_TAG_TABLE_NAME_ENV_VAR)
-    if not tag_table_name:
-        raise MissingEnvironmentVariable(f"{DDB_TAG_TABLE_NAME_ENV_VAR} is missing")
-    
-    ddb_client = boto3.client("dynamodb")
 
-    ddb_resp = _fetch_ddb_results(
-        ddb_client, 
-        DDB_PARTIQL.format(ddb_table_name),
+    pythonic_results = _fetch_ddb_results(
+        DDB_RESOURCE.Table(GLUE_TRACKER_DDB_TABLE_NAME),
+        DDB_FILTER,
+        DDB_PROJECTION,
     )
-
-    ddb_results = ddb_resp.get("Items")
-    if not ddb_results:
+    if not pythonic_results:
         LOGGER.warning("No data sources fetched. Exiting.")
         return
 
-    pythonic_results = unmarshall_ddb_items(ddb_results) 
+    tag_table = DDB_RESOURCE.Table(DDB_TAG_TABLE_NAME)
+
+    table_arns = [obj["data_source_attrs"]["tableDescription"]["tableArn"] for obj in pythonic_results]
+    # tag lookups are network bound, so they are fetched concurrently
+    max_workers = min(MAX_WORKERS, len(table_arns))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        all_table_tags = list(executor.map(functools.partial(get_table_tags, DDB_CLIENT), table_arns))
+
+    # every row of this report run shares the same timestamp
+    time_stamp = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
 
-    for obj in pythonic_results:
-        obj_table_name = obj["data_source_attrs"]["tableDescription"]["tableName"]
-        obj_table_arn = obj["data_source_attrs"]["tableDescription"]["tableArn"]
+    # the batch writer buffers the items into BatchWriteItem requests of up to 25
+    # and resends any unprocessed items
+    with tag_table.batch_writer() as batch:
+        for obj, obj_table_arn, table_tags in zip(pythonic_results, table_arns, all_table_tags):
+            obj_table_name = obj["data_source_attrs"]["tableDescription"]["tableName"]
 
-        LOGGER.info(f"DynamoDB table ARN: {obj_table_arn}")
+            LOGGER.info("DynamoDB table ARN: %s", obj_table_arn)
         
-        table_tags = get_table_tags(ddb_client, obj_table_arn)
-        if not table_tags:
-            LOGGER.error(f"{obj_table_name} does not have any tags. Skipping.")
-            continue
+            if not table_tags:
+                LOGGER.error("%s does not have any tags. Skipping.", obj_table_name)
+                continue
         
-        data_catalog_table_name = obj["data_catalog_table_name"]
-        LOGGER.info(f"Data catalog table name: {data_catalog_table_name}")
+            data_catalog_table_name = obj["data_catalog_table_name"]
+            LOGGER.info("Data catalog table name: %s", data_catalog_table_name)
         
-        tag_obj = {}
+            tag_obj = {}
         
-        for tag in table_tags:
-            if tag["Key"] in REQUIRED_TAG_KEYS:
-                print(tag["Value"])
-                tag_obj[tag["Key"]] = tag["Value"]
-
-        if not tag_obj:
-            LOGGER.error("None of the required tags are present. Skipping.")
-            continue
-        else:
-            LOGGER.info("Attempting to update tag reporting table")
-            tag_obj["id"] = str(uuid.uuid4())
-            tag_obj["data_catalog_table_name"] = data_catalog_table_name
-            tag_obj["time_stamp"] = datetime.datetime.strftime(datetime.datetime.now(), '%Y-%m-%d %H:%M:%S')
-            serializer = TypeSerializer()
-            resp = ddb_client.put_item(
-                TableName="tagCaptureTable",
-                Item={
-                    k: serializer.serialize(v) for k, v in tag_obj.items()
-                    },
-            )
-            _check_missing_field(resp, "ResponseMetadata")
-            _validate_field(resp["ResponseMetadata"], "HTTPStatusCode", 200)
-
-    LOGGER.debug("Closing DynamoDB Boto3 client") 
-    ddb_client.close()
+            for tag in table_tags:
+                if tag["Key"] in REQUIRED_TAG_KEYS:
+                    tag_obj[tag["Key"]] = tag["Value"]
+
+            if not tag_obj:
+                LOGGER.error("None of the required tags are present. Skipping.")
+                continue
+            else:
+                LOGGER.info("Queueing tag reporting table update")
+                tag_obj["id"] = os.urandom(16).hex()
+                tag_obj["data_catalog_table_name"] = data_catalog_table_name
+                tag_obj["time_stamp"] = time_stamp
+                batch.put_item(Item=tag_obj)
@@ -3,6 +3,7 @@ import logging
 import os
 
 import boto3
+from botocore.config import Config
 
 
 LOGGER = logging.getLogger()
@@ -10,6 +11,15 @@ LOGGER = logging.getLogger()
 GLUE_TRACK_QUEUE_URL_ENV_VAR = "GLUE_TRACKING_QUEUE_URL"
 DDB_EXCEPTION_NAMES_ENV_VAR = "EXCEPTION_TABLE_NAMES"
 
+# every stream record's SQS send reuses this pooled connection
+BOTO_CONFIG = Config(
+    tcp_keepalive=True,
+    max_pool_connections=50,
+    retries={"mode": "standard", "max_attempts": 3},
+)
+
+SQS_CLIENT = boto3.client("sqs", config=BOTO_CONFIG)
+
 class MalformedEvent(Exception):
     """Raised if a malformed event received"""
     
@@ -42,6 +52,19 @@ def _configure_logger():
         logging.basicConfig(level=level)
 
 
+# logging and environment only need to be set up once per execution environment
+_configure_logger()
+_silence_noisy_loggers()
+
+GLUE_TRACK_QUEUE_URL = os.environ.get(GLUE_TRACK_QUEUE_URL_ENV_VAR)
+if not GLUE_TRACK_QUEUE_URL:
+    raise MissingEnvironmentVariable(
+        f"{GLUE_TRACK_QUEUE_URL_ENV_VAR} environment variable is required")
+
+# tables listed here are never onboarded
+EXCEPTION_TABLES = frozenset(os.environ.get(DDB_EXCEPTION_NAMES_ENV_VAR, "").split(","))
+
+
 def _check_missing_field(validation_dict, extraction_key):
     """Check if a field exists in a dictionary
 
@@ -53,7 +76,7 @@ def _check_missing_field(validation_dict, extraction_key):
     extracted_value = validation_dict.get(extraction_key)
     
     if not extracted_value:
-        LOGGER.error(f"Missing '{extraction_key}' field in the event")
+        LOGGER.error("Missing '%s' field in the event", extraction_key)
         raise MalformedEvent
     
 
@@ -71,7 +94,7 @@ def _validate_field(validation_dict, extraction_key, expected_value):
     _check_missing_field(validation_dict, extraction_key)
     
     if extracted_value != expected_value:
-        LOGGER.error(f"Incorrect value found for '{extraction_key}' field")
+        LOGGER.error("Incorrect value found for '%s' field", extraction_key)
         raise ValueError
     
 
@@ -106,63 +129,37 @@ def _send_message_to_sqs(client, queue_url, message_dict):
     :param queue_url: String
     :param message_dict: Dictionary
 
-    :raises: Exception
+    :raises: botocore.exceptions.ClientError
     """
-    LOGGER.info(f"Attempting to send message to: {queue_url}")
-    resp = client.send_message(
+    LOGGER.info("Attempting to send message to: %s", queue_url)
+    client.send_message(
         QueueUrl=queue_url,
         MessageBody=json.dumps(message_dict)
     )
-
-    _check_missing_field(resp, "ResponseMetadata")
-    resp_metadata = resp["ResponseMetadata"]
-
-    _check_missing_field(resp_metadata, "HTTPStatusCode")
-    status_code = resp_metadata["HTTPStatusCode"]
-    
-    if status_code == 200:
-        LOGGER.info("Successfully pushed message")
-    else:
-        raise Exception("Unable to push message")   
+    LOGGER.info("Successfully pushed message")
 
    
 def lambda_handler(event, context):
     """What executes when the program is run"""
-    
-    # configure python logger
-    _configure_logger()
-    # silence chatty libraries
-    _silence_noisy_loggers()
-    
-    valid_event = _extract_valid_event(event)
-    LOGGER.info("Extracted data to send to SQS")
-    
-    glue_queue_url = os.environ.get(GLUE_TRACK_QUEUE_URL_ENV_VAR)
-    if not glue_queue_url:
-        raise MissingEnvironmentVariable(
-            f"{GLUE_TRACK_QUEUE_URL_ENV_VAR} environment variable is required")
 
-    exception_tables = os.environ.get(DDB_EXCEPTION_NAMES_ENV_VAR)
-    list_exception_tables = []
-    if exception_tables:
-        list_exception_tables = exception_tables.split(",")
+    valid_event = _extract_valid_event(event)
 
     _check_missing_field(valid_event, "tableDescription")
     _check_missing_field(valid_event["tableDescription"], "tableName")
     ddb_table_name = valid_event["tableDescription"]["tableName"]
     
-    if ddb_table_name in list_exception_tables:
-        LOGGER.warning(f"DynamoDB table: {ddb_table_name} is in the exception list. Exiting.")
-    else:
-        # prepare payload for glue tracking queue
-        message_dict = {}
-        message_dict["data_source_type"] = "dynamodb"
-        message_dict["data_source_attrs"] = valid_event
-        # send message to Glue job tracking Queue
-        sqs_client = boto3.client("sqs")
-        _send_message_to_sqs(
-            sqs_client, 
-            glue_queue_url, 
-            message_dict)
-
-        sqs_client.close()
+    if ddb_table_name in EXCEPTION_TABLES:
+        LOGGER.warning("DynamoDB table: %s is in the exception list. Exiting.", ddb_table_name)
+        return
+
+    LOGGER.info("Extracted data to send to SQS")
+
+    # prepare payload for glue tracking queue
+    message_dict = {}
+    message_dict["data_source_type"] = "dynamodb"
+    message_dict["data_source_attrs"] = valid_event
+    # send message to Glue job tracking Queue
+    _send_message_to_sqs(
+        SQS_CLIENT, 
+        GLUE_TRACK_QUEUE_URL, 
+        message_dict)
@@ -1,10 +1,9 @@
 import json
 import logging
 import os
-import uuid
 
 import boto3
-from boto3.dynamodb.types import TypeSerializer
+from botocore.config import Config
 from botocore.exceptions import ClientError
 
 
@@ -13,6 +12,17 @@ SQS_QUEUE_URL_ENV_VAR = "SQS_QUEUE_URL"
 
 LOGGER = logging.getLogger()
 
+# the tracker writes and SQS messages for every source reuse these
+# pooled connections
+BOTO_CONFIG = Config(
+    tcp_keepalive=True,
+    max_pool_connections=50,
+    retries={"mode": "standard", "max_attempts": 3},
+)
+
+DDB_RESOURCE = boto3.resource("dynamodb", config=BOTO_CONFIG)
+SQS_CLIENT = boto3.client("sqs", config=BOTO_CONFIG)
+
 
 class MalformedEvent(Exception):
     """Raised if a malformed event received"""
@@ -46,6 +56,21 @@ def _configure_logger():
         logging.basicConfig(level=level)
 
 
+# logging and environment only need to be set up once per execution environment
+_configure_logger()
+_silence_noisy_loggers()
+
+DDB_TABLE_NAME = os.environ.get(DDB_TABLE_NAME_ENV_VAR)
+if not DDB_TABLE_NAME:
+    raise MissingEnvironmentVariable(
+        f"{DDB_TABLE_NAME_ENV_VAR} environment variable is required")
+
+SQS_QUEUE_URL = os.environ.get(SQS_QUEUE_URL_ENV_VAR)
+if not SQS_QUEUE_URL:
+    raise MissingEnvironmentVariable(
+        f"{SQS_QUEUE_URL_ENV_VAR} environment variable is required")
+
+
 def _get_sqs_message_attributes(event):
     """Extract receiptHandle from message
     
@@ -117,84 +142,28 @@ def _get_message_body(event):
             raise MalformedEvent("'body' is not valid JSON")
             
 
-def _get_sqs_message_attributes(event):
-    """Extract receiptHandle from message
-    
-    :param event: Dictionary
-    
-    :raises: MalformedEvent
-    
-    :rtype: Dictionary
-    """
-    LOGGER.info("Attempting to extract receiptHandle from SQS")
-    records = event.get("Records")
-    if not records:
-        LOGGER.warning("No receiptHandle found, probably not an SQS message")
-        return
-    try:
-        first_record = records[0]
-    except IndexError:
-        raise MalformedEvent("Records seem to be empty")
-    
-    receipt_handle = first_record.get("receiptHandle")
-    message_id = first_record.get("messageId")
-    
-    if not receipt_handle:
-        raise MalformedEvent("No receiptHandle present")
-    
-    if not message_id:
-        raise MalformedEvent("No messageId present")
-    
-    return {
-        "message_id": message_id,
-        "receipt_handle": receipt_handle
-    }
-
-
-def _delete_sqs_message(msg_attr):
+def _delete_sqs_message(client, msg_attr):
     """Delete message from queue (lest it remain in the queue forever)
 
+    :param client: Boto3 client object (SQS)
     :param msg_attr: Dictionary
 
-    :raises: MissingEnvironmentVariable
-    :raises: Exception
+    :raises: botocore.exceptions.ClientError
     """
-    LOGGER.info(f"Deleting message {msg_attr['message_id']} from sqs")
-    sqs_client = boto3.client("sqs")
-    queue_url = os.environ.get(SQS_QUEUE_URL_ENV_VAR)
-    if not queue_url:
-        raise MissingEnvironmentVariable(
-            f"{SQS_QUEUE_URL_ENV_VAR} environment variable is required")
-            
-    deletion_resp = sqs_client.delete_message(
-        QueueUrl=queue_url, ReceiptHandle=msg_attr["receipt_handle"])
-    
-    sqs_client.close()
-
-    resp_metadata = deletion_resp.get("ResponseMetadata")
-    if not resp_metadata:
-        raise Exception("No response metadata from deletion call")
-    status_code = resp_metadata.get("HTTPStatusCode")
-    
-    if status_code == 200:
-        LOGGER.info(f"Successfully deleted message")
-    else:
-        raise Exception("Unable to delete message")
+    LOGGER.info("Deleting message %s from sqs", msg_attr["message_id"])
+    client.delete_message(
+        QueueUrl=SQS_QUEUE_URL, ReceiptHandle=msg_attr["receipt_handle"])
+    LOGGER.info("Successfully deleted message")
         
 
 def lambda_handler(event, context):
     """What executes when the program is run"""
-    
-    # configure python logger for Lambda
-    _configure_logger()
-    # silence chatty libraries for better logging
-    _silence_noisy_loggers()
-    
+
     msg_attr = _get_sqs_message_attributes(event)
     
     if msg_attr:
         # Because messages remain in the queue
-        _delete_sqs_message(msg_attr)
+        _delete_sqs_message(SQS_CLIENT, msg_attr)
 
     # TODO: figure out DLQ mechanism or create another queue for unprocessed stuff
     # or delete the message after the item is written successfully in DDB
@@ -202,36 +171,24 @@ def lambda_handler(event, context):
     body = _get_message_body(event)
 
     # put record in Glue Job Tracker DDB Table
-    ddb_table_name = os.environ.get(DDB_TABLE_NAME_ENV_VAR)
-    if not ddb_table_name:
-        raise MissingEnvironmentVariable(
-            f"{DDB_TABLE_NAME_ENV_VAR} environment variable is required")
-
-    ddb_client = boto3.client("dynamodb")
-    unique_id = uuid.uuid4()
+    unique_id = os.urandom(16).hex()
 
     python_obj = {
-        "id": str(unique_id),
+        "id": unique_id,
         "data_source_type": body["data_source_type"],
         "glue_job_created": False,
         "data_catalog_entry": False,
         "data_source_attrs": body["data_source_attrs"]
     }
-    serializer = TypeSerializer()
     try:
-        resp = ddb_client.put_item(
-            TableName=ddb_table_name,
-            Item={
-                k: serializer.serialize(v) for k, v in python_obj.items()
-                },
+        DDB_RESOURCE.Table(DDB_TABLE_NAME).put_item(
+            Item=python_obj,
             ConditionExpression="attribute_not_exists(id)",
         )
         LOGGER.info("Successfully initialized item in Glue Tracker DynamoDB")
     except ClientError as e:
         if e.response["Error"]["Code"] == "ConditionalCheckFailedException":
-            LOGGER.error(f"An entry with primary key: {unique_id} already exists")
+            LOGGER.error("An entry with primary key: %s already exists", unique_id)
         else:
             LOGGER.error("Unable to ")
             raise Exception
-    
-    ddb_client.close()
@@ -1,29 +1,48 @@
-import copy
-import datetime
+import functools
 import logging
 import os
+from concurrent.futures import ThreadPoolExecutor
 
 import boto3
-from boto3.dynamodb.types import TypeDeserializer
+from botocore.config import Config
 
 
 LOGGER = logging.getLogger()
 
-PARTIQL = "SELECT * FROM {} WHERE data_source_type = '{}'"
-
-PII_PARTIQL = """
-SELECT columnName, entityTypes FROM {} WHERE data_catalog_table='{}' AND "timestamp"='{}'
+# only the attributes the report reads are returned
+PARTIQL = """
+SELECT data_catalog_table, data_catalog_database, "timestamp", columnName, entityTypes FROM {} WHERE data_source_type = ?
 """
 
-DATE_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
-
 LOGGER = logging.getLogger()
 
-DELETE_PROPS = ['CreateTime', 'UpdateTime',  'CreatedBy', 'IsRegisteredWithLakeFormation', 'CatalogId', 'VersionId', 'DatabaseName']
+# GetTable output properties that are not accepted as UpdateTable TableInput
+DELETE_PROPS = frozenset({'CreateTime', 'UpdateTime',  'CreatedBy', 'IsRegisteredWithLakeFormation', 'CatalogId', 'VersionId', 'DatabaseName'})
 
 PII_OUTPUT_TABLE = "OUTPUT_TABLE_NAME"
 DATA_SOURCE = "DATA_SOURCE_NAME"
 
+# glue column comments are limited to 255 characters
+COMMENT_PREFIX = "Sensitive Data Element | "
+MAX_ENTITY_TYPES_LENGTH = 255 - len(COMMENT_PREFIX)
+
+# upper bound on concurrent catalog tables processed per invocation
+MAX_WORKERS = 16
+
+# the per-table scan workers share these pooled connections; read_timeout
+# bounds a stalled scan page
+BOTO_CONFIG = Config(
+    tcp_keepalive=True,
+    max_pool_connections=50,
+    connect_timeout=3,
+    read_timeout=30,
+    retries={"mode": "adaptive", "max_attempts": 10},
+)
+
+DDB_RESOURCE = boto3.resource("dynamodb", config=BOTO_CONFIG)
+GLUE_CLIENT = boto3.client("glue", config=BOTO_CONFIG)
+STS_CLIENT = boto3.client("sts", config=BOTO_CONFIG)
+
 
 class MalformedEvent(Exception):
     """Raised if a malformed event received"""
@@ -57,6 +76,11 @@ def _configure_logger():
         logging.basicConfig(level=level)
 
 
+# logging only needs to be set up once per execution environment
+_configure_logger()
+_silence_noisy_loggers()
+
+
 def _check_missing_field(validation_dict, extraction_key):
     """Check if a field exists in a dictionary
 
@@ -90,44 +114,45 @@ def _validate_field(validation_dict, extraction_key, expected_value):
         raise ValueError
     
 
-def _fetch_ddb_results(client, query):
-    """Fetch results from PartiQL DynamoDB query
-
-    :param client: Boto3 client (DynamoDB)
-    :param query: String
+@functools.lru_cache(maxsize=1)
+def _get_account_id():
+    """Fetch the account id via STS (cached, it never changes for a given function)
 
-    :rtype: List
+    :rtype: String
     """
-    resp = client.execute_statement(Statement=query)
+    return STS_CLIENT.get_caller_identity()["Account"]
 
-    _check_missing_field(resp, "ResponseMetadata")
 
-    _validate_field(resp["ResponseMetadata"], "HTTPStatusCode", 200)
+def _fetch_ddb_results(client, query, parameters):
+    """Fetch results from PartiQL DynamoDB query
 
-    return resp
+    :param client: Boto3 client (DynamoDB resource client, items are deserialized by boto3)
+    :param query: String
+    :param parameters: List (values for the ? placeholders)
 
+    :rtype: List
+    """
+    items = []
+    statement_kwargs = {"Statement": query, "Parameters": parameters}
 
-def unmarshall_ddb_items(ddb_items):
-    """Deserialize ddb_items
+    while True:
+        resp = client.execute_statement(**statement_kwargs)
 
-    :param ddb_items: List
+        _check_missing_field(resp, "ResponseMetadata")
 
-    :rtype: List
-    """
-    unmarshalled = []
+        _validate_field(resp["ResponseMetadata"], "HTTPStatusCode", 200)
 
-    deserializer = TypeDeserializer()
+        items.extend(resp.get("Items", []))
 
-    for ddb_item in ddb_items:
-        unmarshalled.append(
-            {k: deserializer.deserialize(v) for k, v in ddb_item.items()}
-        )
-    
-    return unmarshalled
+        # results are paginated at 1MB
+        next_token = resp.get("NextToken")
+        if not next_token:
+            return items
+        statement_kwargs["NextToken"] = next_token
 
 
 def glue_get_table(client, table_name, account_id, database_name):
-    """Execute PARTIQL statement against DynamoDB
+    """Fetch the Glue Data Catalog table
     
     :param client: Boto3 client object
     :param table_name: String
@@ -159,10 +184,15 @@ def update_catalog_table(client, table_name, database_name, account_id, columns)
     
     :raises Exception
     """
+    # lower cased column name -> column comment
     pii_col_dict = {}
     
     for col in columns:
-        pii_col_dict[col["columnName"].lower()] = str(col["entityTypes"])
+        entity_types = str(col["entityTypes"])
+        if len(entity_types) > MAX_ENTITY_TYPES_LENGTH:
+            LOGGER.warning(f"Entity types '{entity_types}' do not fit in the column comment. Will trim them")
+            entity_types = entity_types[:MAX_ENTITY_TYPES_LENGTH]
+        pii_col_dict[col["columnName"].lower()] = f"{COMMENT_PREFIX}{entity_types}"
             
     table_resp = glue_get_table(client, table_name, account_id, database_name)
     
@@ -172,30 +202,33 @@ def update_catalog_table(client, table_name, database_name, account_id, columns)
         LOGGER.error("No valid table returned.")
         raise Exception
         
-    update_table_dict = copy.deepcopy(table_dict)
-
-    version = update_table_dict["VersionId"]
+    version = table_dict["VersionId"]
     
-    for del_prop in DELETE_PROPS:
-        del update_table_dict[del_prop]
-    
-    catalog_cols = copy.deepcopy(update_table_dict["StorageDescriptor"]["Columns"])
+    catalog_cols = table_dict["StorageDescriptor"]["Columns"]
 
     update_cols = []
-    pii_col_list = list(pii_col_dict.keys())
+    changed = False
+    # bound once, both are called for every column of the table
+    get_comment = pii_col_dict.get
+    append_col = update_cols.append
 
     for col_obj in catalog_cols:
-        col_name = col_obj["Name"]
-        if col_name in pii_col_list:
-            comment_str = f"Sensitive Data Element | {pii_col_dict[col_name]}"
-            if len(comment_str) > 255:
-                LOGGER.warning(f"Comment string '{comment_str}' is longer than 255 characters. Will trim it")
-                comment_str = comment_str[:255]
-            col_obj["Comment"] = comment_str
+        # PII column names are lower cased, glue column names may not be
+        comment_str = get_comment(col_obj["Name"].lower())
+        if comment_str and comment_str != col_obj.get("Comment"):
+            col_obj = {**col_obj, "Comment": comment_str}
+            changed = True
             
-        update_cols.append(col_obj)
+        append_col(col_obj)
+    
+    if not changed:
+        # an update would only bump the table version without changing anything
+        LOGGER.info(f"Column comments of table {table_name} are already up to date")
+        return
             
-    update_table_dict["StorageDescriptor"]["Columns"] = update_cols
+    # shallow copies are enough, the fetched table itself is never modified
+    update_table_dict = {k: v for k, v in table_dict.items() if k not in DELETE_PROPS}
+    update_table_dict["StorageDescriptor"] = {**table_dict["StorageDescriptor"], "Columns": update_cols}
     
     resp = client.update_table(
         CatalogId=account_id,
@@ -211,13 +244,27 @@ def update_catalog_table(client, table_name, database_name, account_id, columns)
     LOGGER.info("Successfully update Glue Data Catalog Table")
     
 
+def _process_table(table, table_meta, glue_client, account_id):
+    """Update the column comments of a catalog table with its latest PII elements
+
+    :param table: String
+    :param table_meta: Dictionary
+    :param glue_client: Boto3 client object (Glue)
+    :param account_id: String
+    """
+    LOGGER.info(f"Updating PII elements for table: {table}")
+            
+    update_catalog_table(
+        glue_client, 
+        table, 
+        table_meta["catalog_database_name"], 
+        account_id, 
+        table_meta["columns"]
+    )
+
+
 def lambda_handler(event, context):
     """What executes when the program is run"""
-    
-    # configure python logger
-    _configure_logger()
-    # silence chatty libraries
-    _silence_noisy_loggers()
 
     ddb_table_name = os.environ.get(PII_OUTPUT_TABLE)
     if not ddb_table_name:
@@ -227,71 +274,44 @@ def lambda_handler(event, context):
     if not data_source:
         raise MissingEnvironmentVariable(f"{DATA_SOURCE} is missing")
     
-    ddb_client = boto3.client("dynamodb")
-
-    ddb_resp = _fetch_ddb_results(
-        ddb_client, 
-        PARTIQL.format(ddb_table_name, data_source),
+    pythonic_results = _fetch_ddb_results(
+        DDB_RESOURCE.meta.client, 
+        PARTIQL.format(ddb_table_name),
+        [data_source],
     )
-
-    ddb_results = ddb_resp.get("Items")
-    if not ddb_results:
+    if not pythonic_results:
         LOGGER.warning("No results fetched. Exiting.")
         return
 
-    pythonic_results = unmarshall_ddb_items(ddb_results)
-
-    catalog_tables_dict = {}  
-    # fetching latest timestamp per catalog table
+    catalog_tables_dict = {}
+    get_catalog_table = catalog_tables_dict.get
+    # keeping the rows of the latest report per catalog table, these carry its PII elements.
+    # the timestamps are zero padded (%Y-%m-%d %H:%M:%S.%f), so string order is chronological
     for rec in pythonic_results:
-        keys = catalog_tables_dict.keys()
         catalog_table = rec["data_catalog_table"]
         time_str = rec["timestamp"]
-        timestamp = datetime.datetime.strptime(time_str, DATE_FORMAT)
+        existing_obj = get_catalog_table(catalog_table)
+        existing_time_str = existing_obj["time_str"] if existing_obj is not None else None
         
-        if catalog_table not in keys:
-            obj = {
+        if existing_time_str is None or time_str > existing_time_str:
+            catalog_tables_dict[catalog_table] = {
                 "catalog_database_name": rec["data_catalog_database"],
-                "timestamp": timestamp,
-                "time_str": time_str
+                "time_str": time_str,
+                "columns": [rec]
             }
-            catalog_tables_dict[catalog_table] = obj
-        else:
-            existing_obj = catalog_tables_dict[catalog_table]
-            if timestamp > existing_obj["timestamp"]:
-                catalog_tables_dict[catalog_table]["timestamp"] = timestamp
-                catalog_tables_dict[catalog_table]["time_str"] = time_str
-    
-    # need account id for glue API calls
-    account_id = boto3.client("sts").get_caller_identity()["Account"]
- 
-    glue_client = boto3.client("glue")
+        elif time_str == existing_time_str:
+            existing_obj["columns"].append(rec)
 
-    for table in catalog_tables_dict.keys():
-        
-        LOGGER.info(f"Fetching PII elements from table: {table}")
-        
-        pii_results = _fetch_ddb_results(
-            ddb_client, 
-            PII_PARTIQL.format(
-                ddb_table_name, 
-                table, 
-                catalog_tables_dict[table]["time_str"])
-            )
-            
-        pii_items = pii_results.get("Items")
-        pythonic_pii_items = unmarshall_ddb_items(pii_items)
-                
-        update_catalog_table(
-            glue_client, 
-            table, 
-            catalog_tables_dict[table]["catalog_database_name"], 
-            account_id, 
-            pythonic_pii_items
-        )
-
-    LOGGER.debug("Closing Glue Boto3 client") 
-    glue_client.close()
+    # need account id for glue API calls
+    account_id = _get_account_id()
 
-    LOGGER.debug("Closing DynamoDB Boto3 client") 
-    ddb_client.close()
+    process_table = functools.partial(
+        _process_table,
+        glue_client=GLUE_CLIENT,
+        account_id=account_id,
+    )
+    # Glue calls are network bound, so the tables are processed concurrently
+    max_workers = min(MAX_WORKERS, len(catalog_tables_dict))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # consuming the results re-raises any exception from the workers
+        list(executor.map(process_table, catalog_tables_dict.keys(), catalog_tables_dict.values()))
@@ -1,9 +1,15 @@
-import json
+import codecs
+import datetime
+import functools
+import itertools
 import logging
 import os
+import re
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 import boto3
+from botocore.config import Config
 from botocore.exceptions import ClientError
 
 
@@ -15,6 +21,42 @@ LOGGER = logging.getLogger()
 
 DDL_FILE = "rds-ddl.sql"
 
+# statements are streamed from the DDL source in chunks of this many characters
+DDL_READ_CHUNK_SIZE = 64 * 1024
+
+# statements per Data API transaction, keeps each transaction well within its timeout
+DDL_TRANSACTION_MAX_STATEMENTS = 200
+
+# RDS tags the secrets it manages with the ARN of the owning cluster
+MANAGED_SECRET_TAG_KEY = "aws:rds:primaryDBClusterArn"
+
+# upper bound on concurrent secret lookups when no managed secret is found
+SECRET_LOOKUP_MAX_WORKERS = 10
+
+# only the cluster identifier is needed from each secret, so skip parsing the whole document
+CLUSTER_ID_PATTERN = re.compile(r'"dbClusterIdentifier"\s*:\s*"([^"]+)"')
+
+REGION = os.environ.get(REGION_ENV_VAR)
+
+# backoff (in seconds) while waiting for the DDL source file to be redeployed
+DDL_SOURCE_WAIT_DELAYS = (1, 2, 4, 8, 16, 32, 64)
+EVENT_TIME_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+
+# the secret lookup workers and the Data API statements share these
+# pooled connections
+BOTO_CONFIG = Config(
+    tcp_keepalive=True,
+    max_pool_connections=50,
+    connect_timeout=3,
+    retries={"mode": "adaptive", "max_attempts": 10},
+)
+
+RDS_CLIENT = boto3.client("rds", config=BOTO_CONFIG)
+RDS_DATA_CLIENT = boto3.client("rds-data", config=BOTO_CONFIG)
+S3_CLIENT = boto3.client("s3", config=BOTO_CONFIG)
+SM_CLIENT = boto3.client("secretsmanager", config=BOTO_CONFIG)
+STS_CLIENT = boto3.client("sts", config=BOTO_CONFIG)
+
 
 class MalformedEvent(Exception):
     """Raised if a malformed event received"""
@@ -80,7 +122,21 @@ def _configure_logger():
         logging.basicConfig(level=level)
 
 
-def _execute_sql(client, secret, dbname, resource_arn, sql):
+# logging only needs to be set up once per execution environment
+_configure_logger()
+_silence_noisy_loggers()
+
+
+@functools.lru_cache(maxsize=1)
+def _get_account_id():
+    """Fetch the account id via STS (cached, it never changes for a given function)
+
+    :rtype: String
+    """
+    return STS_CLIENT.get_caller_identity()["Account"]
+
+
+def _execute_sql(client, secret, dbname, resource_arn, sql, transaction_id):
     """Execute passed in SQL against RDS using the Data API
 
     :param client: RDS Data Client Object (boto3)
@@ -88,6 +144,7 @@ def _execute_sql(client, secret, dbname, resource_arn, sql):
     :param dbname: String
     :param resource_arn: String
     :param SQL: String (sql to be executed)
+    :param transaction_id: String
 
     :raises: Exception
     """
@@ -97,6 +154,7 @@ def _execute_sql(client, secret, dbname, resource_arn, sql):
         secretArn=secret,
         database=dbname,
         sql=sql,
+        transactionId=transaction_id,
         )
 
     if response["ResponseMetadata"]["HTTPStatusCode"] == 200:
@@ -107,8 +165,69 @@ def _execute_sql(client, secret, dbname, resource_arn, sql):
         raise Exception
     
 
-def _get_ddl_source_file_contents(client, bucket, filename):
-    """Fetch the contents of the DDL SQL file
+def _execute_in_transaction(client, secret, dbname, resource_arn, sql_statements):
+    """Execute the statements in one Data API transaction, rolling back on failure
+
+    :param client: RDS Data Client Object (boto3)
+    :param secret: String (ARN of the secret)
+    :param dbname: String
+    :param resource_arn: String
+    :param sql_statements: List (sql statements to be executed in order)
+
+    :raises: botocore.exceptions.ClientError
+    """
+    transaction_id = client.begin_transaction(
+        resourceArn=resource_arn,
+        secretArn=secret,
+        database=dbname,
+        )["transactionId"]
+
+    try:
+        for sql in sql_statements:
+            _execute_sql(client, secret, dbname, resource_arn, sql, transaction_id)
+    except Exception as e:
+        LOGGER.error("Rolling back DDL transaction")
+        client.rollback_transaction(
+            resourceArn=resource_arn,
+            secretArn=secret,
+            transactionId=transaction_id,
+            )
+        raise e
+
+    client.commit_transaction(
+        resourceArn=resource_arn,
+        secretArn=secret,
+        transactionId=transaction_id,
+        )
+    LOGGER.info(f"Successfully committed {len(sql_statements)} DDL statements")
+
+
+def _execute_ddl(client, secret, dbname, resource_arn, sql_statements):
+    """Execute the DDL statements in bounded transactions using the Data API
+
+    The statements are committed in chunks of DDL_TRANSACTION_MAX_STATEMENTS,
+    each of which shares one connection and is applied all-or-nothing. If a
+    statement fails, its chunk is rolled back, while the chunks committed
+    before it stay applied and the remaining statements are not run.
+
+    :param client: RDS Data Client Object (boto3)
+    :param secret: String (ARN of the secret)
+    :param dbname: String
+    :param resource_arn: String
+    :param sql_statements: Iterable (sql statements to be executed in order)
+
+    :raises: botocore.exceptions.ClientError
+    """
+    sql_statements = iter(sql_statements)
+    while True:
+        chunk = list(itertools.islice(sql_statements, DDL_TRANSACTION_MAX_STATEMENTS))
+        if not chunk:
+            return
+        _execute_in_transaction(client, secret, dbname, resource_arn, chunk)
+
+
+def _iter_ddl_statements(client, bucket, filename):
+    """Stream the DDL SQL file and yield its statements one at a time
 
     :param client: boto3 Client Object (S3)
     :param bucket: String
@@ -116,7 +235,7 @@ def _get_ddl_source_file_contents(client, bucket, filename):
 
     :raises: Exception
 
-    :rtype String
+    :rtype Iterator
     """
     resp = client.get_object(Bucket=bucket, Key=filename)
 
@@ -125,27 +244,76 @@ def _get_ddl_source_file_contents(client, bucket, filename):
     _validate_field(resp["ResponseMetadata"], "HTTPStatusCode", 200)
 
     _check_missing_field(resp, "Body")
-    body_obj = resp["Body"]
+    reader = codecs.getreader("utf-8")(resp["Body"])
     
-    return body_obj.read().decode("utf-8")
+    buf = ""
+    while True:
+        chunk = reader.read(DDL_READ_CHUNK_SIZE)
+        if not chunk:
+            break
+        buf += chunk
+        # the last piece may be an incomplete statement, keep it for the next chunk
+        *sql_statements, buf = buf.split(";")
+        for sql in sql_statements:
+            # get rid of white spaces
+            eff_sql = sql.strip(" \n\t")
+            if eff_sql:
+                yield eff_sql
 
+    eff_sql = buf.strip(" \n\t")
+    if eff_sql:
+        yield eff_sql
+
+
+def _get_event_time(event):
+    """Return the time of the triggering event (None if not present)
+
+    :param event: Dictionary
+
+    :rtype: datetime.datetime
+    """
+    event_time = event.get("time")
+    if not event_time:
+        return None
+    return datetime.datetime.strptime(event_time, EVENT_TIME_FORMAT).replace(
+        tzinfo=datetime.timezone.utc)
 
-def get_db_cluster_id_from_secret_name(secret_name):
+
+def _wait_for_ddl_source_update(client, bucket, filename, since):
+    """Wait (with exponential backoff) for the DDL SQL file to be written after the given time
+
+    :param client: boto3 Client Object (S3)
+    :param bucket: String
+    :param filename: String
+    :param since: datetime.datetime
+
+    :raises: botocore.exceptions.ClientError
+    """
+    for delay in DDL_SOURCE_WAIT_DELAYS:
+        try:
+            resp = client.head_object(Bucket=bucket, Key=filename)
+            if since is None or resp["LastModified"] >= since:
+                LOGGER.info("DDL source is up to date")
+                return
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "404":
+                raise e
+        LOGGER.info(f"Waiting {delay}s for DDL source to be updated..")
+        time.sleep(delay)
+
+    LOGGER.warning("DDL source was not updated in time. Will use the current version.")
+
+
+def get_db_cluster_id_from_secret_name(client, secret_name):
     """Return DB Cluster ID from secret
 
+    :param client: boto3 Client Object (Secrets Manager)
     :param secret_name: String
     
     :raises: botocore.exceptions.ClientError
     
     :rtype: String
     """
-    session = boto3.session.Session()
-
-    # Initializing Secret Manager's client    
-    client = session.client(
-        service_name='secretsmanager',
-            region_name=os.environ.get("AWS_REGION", session.region_name)
-        )
     LOGGER.info(f"Attempting to get secret value for: {secret_name}")
     try:
         get_secret_value_response = client.get_secret_value(
@@ -158,27 +326,57 @@ def get_db_cluster_id_from_secret_name(secret_name):
     
     _check_missing_field(get_secret_value_response, "SecretString")
     
-    secret_dict = json.loads(get_secret_value_response["SecretString"])
+    match = CLUSTER_ID_PATTERN.search(get_secret_value_response["SecretString"])
     
-    cluster_id = secret_dict.get("dbClusterIdentifier")
+    cluster_id = match.group(1) if match else None
     if not cluster_id:
         LOGGER.warning("Secret does not contain dbClusterIdentifier")
     
     return cluster_id
 
 
-def _fetch_secret_for_db(cluster_identifier):
+def _fetch_managed_secret_for_db(client, cluster_arn):
+    """Fetch the arn of the RDS managed secret for the database cluster
+
+    :param client: boto3 Client Object (Secrets Manager)
+    :param cluster_arn: String
+
+    :rtype: String
+    """
+    resp = client.list_secrets(
+        Filters=[
+            {"Key": "tag-key", "Values": [MANAGED_SECRET_TAG_KEY]},
+            {"Key": "tag-value", "Values": [cluster_arn]},
+        ]
+    )
+
+    _check_missing_field(resp, "ResponseMetadata")
+
+    _validate_field(resp["ResponseMetadata"], "HTTPStatusCode", 200)
+
+    secrets = resp.get("SecretList")
+    if not secrets:
+        return ""
+    
+    LOGGER.info("Found managed secret for the database")
+    return secrets[0]["ARN"]
+
+
+def _fetch_secret_for_db(client, cluster_identifier, cluster_arn):
     """Fetch the secret arn, name for the database cluster
 
+    :param client: boto3 Client Object (Secrets Manager)
     :param cluster_identifier: String
+    :param cluster_arn: String
 
     :rtype: String
     """
-    arn = ""
-
-    sm_client = boto3.client("secretsmanager")
+    arn = _fetch_managed_secret_for_db(client, cluster_arn)
+    if arn:
+        return arn
 
-    resp = sm_client.list_secrets()
+    LOGGER.info("No managed secret found. Will check the cluster id of every secret")
+    resp = client.list_secrets()
 
     _check_missing_field(resp, "ResponseMetadata")
 
@@ -186,34 +384,36 @@ def _fetch_secret_for_db(cluster_identifier):
 
     _check_missing_field(resp, "SecretList")
 
-    for secret in resp["SecretList"]:
-        _check_missing_field(secret, "Name")
-        cluster_id = get_db_cluster_id_from_secret_name(secret["Name"])
-        
-        if not cluster_id:
-            LOGGER.warning("No cluster ID fetched from secret name")
-            continue
-        
-        if cluster_id == cluster_identifier:
-            LOGGER.info("Found matching secret for the database")
-            _check_missing_field(secret, "ARN")
-            arn = secret["ARN"]
-            break
+    arn = ""
+    # secret values are fetched concurrently, stopping at the first match
+    with ThreadPoolExecutor(max_workers=SECRET_LOOKUP_MAX_WORKERS) as executor:
+        futures = {}
+        for secret in resp["SecretList"]:
+            _check_missing_field(secret, "Name")
+            future = executor.submit(get_db_cluster_id_from_secret_name, client, secret["Name"])
+            futures[future] = secret
+
+        for future in as_completed(futures):
+            cluster_id = future.result()
+            
+            if not cluster_id:
+                LOGGER.warning("No cluster ID fetched from secret name")
+                continue
+            
+            if cluster_id == cluster_identifier:
+                LOGGER.info("Found matching secret for the database")
+                secret = futures[future]
+                _check_missing_field(secret, "ARN")
+                arn = secret["ARN"]
+                for pending in futures:
+                    pending.cancel()
+                break
 
-    sm_client.close()
     return arn
 
 
 def lambda_handler(event, context):
     """What executes when the program is run"""
-    
-    # configure python logger for Lambda
-    _configure_logger()
-    # silence chatty libraries for better logging
-    _silence_noisy_loggers()
-
-    LOGGER.info("Waiting for DDL source to be updated..")
-    time.sleep(120)
 
     ddl_source_file = os.environ.get("DDL_SOURCE_FILE_RDS", DDL_FILE)
     source_s3_bucket = os.environ.get(DDL_SOURCE_BUCKET_ENV_VAR)
@@ -226,12 +426,11 @@ def lambda_handler(event, context):
         raise MissingEnvironmentVariable(DDL_SOURCE_BUCKET_ENV_VAR)
     
     cluster_arn = ""
+    secret_arn = ""
     cluster_id = source_s3_bucket.replace("ddl-source-", "")
     
-    rds_client = boto3.client("rds")
     LOGGER.info("Attempting to get cluster arn from RDS")
-    resp = rds_client.describe_db_clusters(DBClusterIdentifier=cluster_id)
-    rds_client.close()
+    resp = RDS_CLIENT.describe_db_clusters(DBClusterIdentifier=cluster_id)
     
     _check_missing_field(resp, "ResponseMetadata")
     _validate_field(resp["ResponseMetadata"], "HTTPStatusCode", 200)
@@ -241,21 +440,22 @@ def lambda_handler(event, context):
         cluster_details = resp["DBClusters"][0]
         _check_missing_field(cluster_details, "DBClusterArn")
         cluster_arn = cluster_details["DBClusterArn"]
+        # only present when RDS manages the master user password in Secrets Manager
+        secret_arn = cluster_details.get("MasterUserSecret", {}).get("SecretArn", "")
     except IndexError:
         LOGGER.error("No clusters returned from the API call")
 
     if not cluster_arn:
         LOGGER.warning("Unable to fetch cluster arn from RDS API call."
                        " Will attempt to infer it.")
-        region = os.environ.get(REGION_ENV_VAR)
-        if not region:
+        if not REGION:
             raise MissingEnvironmentVariable(REGION_ENV_VAR)
         
-        account_id = boto3.client('sts').get_caller_identity().get('Account')
+        account_id = _get_account_id()
         if not account_id:
             LOGGER.warning("Unable to fetch account_id from sts")
         else:
-            cluster_arn = f"arn:aws:rds:{region}:{account_id}:cluster:{cluster_id}"
+            cluster_arn = f"arn:aws:rds:{REGION}:{account_id}:cluster:{cluster_id}"
     
     if not cluster_arn:
         LOGGER.error("Unable to find a matching cluster ARN. Exiting.")
@@ -263,29 +463,20 @@ def lambda_handler(event, context):
     
     LOGGER.info(f"Cluster ARN: {cluster_arn}")
     
-    secret_arn = _fetch_secret_for_db(cluster_id)
+    if not secret_arn:
+        secret_arn = _fetch_secret_for_db(SM_CLIENT, cluster_id, cluster_arn)
     if not secret_arn:
         LOGGER.error(
             f"No matching secret found associated with the cluster: {cluster_id}. Exiting")
         raise Exception
     
-    s3_client = boto3.client("s3")
-    file_content_string = _get_ddl_source_file_contents(
-        s3_client, source_s3_bucket, ddl_source_file)
-    s3_client.close()
-
-    rds_data_client = boto3.client("rds-data")
-
-    sql_statements = file_content_string.split(";")
-    for sql in sql_statements:
-        # get rid of white spaces
-        eff_sql = sql.strip(" \n\t")
-        if eff_sql:
-            _execute_sql(
-                rds_data_client, 
-                secret_arn,
-                db_name,
-                cluster_arn,
-                eff_sql)
-
-    rds_data_client.close()
\ No newline at end of file
+    # the changeset event fires before the new DDL source is deployed to the bucket
+    _wait_for_ddl_source_update(
+        S3_CLIENT, source_s3_bucket, ddl_source_file, _get_event_time(event))
+
+    _execute_ddl(
+        RDS_DATA_CLIENT, 
+        secret_arn,
+        db_name,
+        cluster_arn,
+        _iter_ddl_statements(S3_CLIENT, source_s3_bucket, ddl_source_file))
\ No newline at end of file
@@ -1,8 +1,13 @@
+import codecs
+import itertools
 import json
 import logging
 import os
+import re
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 import boto3
+from botocore.config import Config
 from botocore.exceptions import ClientError
 
 
@@ -14,6 +19,36 @@ LOGGER = logging.getLogger()
 
 DDL_FILE = "rds-ddl.sql"
 
+# statements are streamed from the DDL source in chunks of this many characters
+DDL_READ_CHUNK_SIZE = 64 * 1024
+
+# statements per Data API transaction, keeps each transaction well within its timeout
+DDL_TRANSACTION_MAX_STATEMENTS = 200
+
+# RDS tags the secrets it manages with the ARN of the owning cluster
+MANAGED_SECRET_TAG_KEY = "aws:rds:primaryDBClusterArn"
+
+# upper bound on concurrent secret lookups when no managed secret is found
+SECRET_LOOKUP_MAX_WORKERS = 10
+
+# only the cluster identifier is needed from each secret, so skip parsing the whole document
+CLUSTER_ID_PATTERN = re.compile(r'"dbClusterIdentifier"\s*:\s*"([^"]+)"')
+
+# the secret lookup workers and the Data API statements share these
+# pooled connections
+BOTO_CONFIG = Config(
+    tcp_keepalive=True,
+    max_pool_connections=50,
+    connect_timeout=3,
+    retries={"mode": "adaptive", "max_attempts": 10},
+)
+
+RDS_CLIENT = boto3.client("rds", config=BOTO_CONFIG)
+RDS_DATA_CLIENT = boto3.client("rds-data", config=BOTO_CONFIG)
+S3_CLIENT = boto3.client("s3", config=BOTO_CONFIG)
+SM_CLIENT = boto3.client("secretsmanager", config=BOTO_CONFIG)
+SQS_CLIENT = boto3.client("sqs", config=BOTO_CONFIG)
+
 
 class MalformedEvent(Exception):
     """Raised if a malformed event received"""
@@ -47,6 +82,11 @@ def _configure_logger():
         logging.basicConfig(level=level)
 
 
+# logging only needs to be set up once per execution environment
+_configure_logger()
+_silence_noisy_loggers()
+
+
 def _check_missing_field(validation_dict, extraction_key):
     """Check if a field exists in a dictionary
 
@@ -147,22 +187,16 @@ def _get_sqs_message_attributes(event):
     }
 
 
-def get_db_cluster_id_from_secret_name(secret_name):
+def get_db_cluster_id_from_secret_name(client, secret_name):
     """Return DB Cluster ID from secret
 
+    :param client: boto3 Client Object (Secrets Manager)
     :param secret_name: String
     
     :raises: botocore.exceptions.ClientError
     
     :rtype: String
     """
-    session = boto3.session.Session()
-
-    # Initializing Secret Manager's client    
-    client = session.client(
-        service_name='secretsmanager',
-            region_name=os.environ.get("AWS_REGION", session.region_name)
-        )
     LOGGER.info(f"Attempting to get secret value for: {secret_name}")
     try:
         get_secret_value_response = client.get_secret_value(
@@ -175,27 +209,80 @@ def get_db_cluster_id_from_secret_name(secret_name):
     
     _check_missing_field(get_secret_value_response, "SecretString")
     
-    secret_dict = json.loads(get_secret_value_response["SecretString"])
+    match = CLUSTER_ID_PATTERN.search(get_secret_value_response["SecretString"])
     
-    cluster_id = secret_dict.get("dbClusterIdentifier")
+    cluster_id = match.group(1) if match else None
     if not cluster_id:
         LOGGER.warning("Secret does not contain dbClusterIdentifier")
     
     return cluster_id
 
 
-def _fetch_secret_for_db(cluster_identifier):
-    """Fetch the secret arn, name for the database cluster
+def _fetch_master_user_secret_for_db(client, cluster_identifier):
+    """Fetch the arn of the master user secret RDS manages for the database cluster
 
+    :param client: boto3 Client Object (RDS)
     :param cluster_identifier: String
 
     :rtype: String
     """
-    arn = ""
+    resp = client.describe_db_clusters(DBClusterIdentifier=cluster_identifier)
+
+    _check_missing_field(resp, "ResponseMetadata")
+
+    _validate_field(resp["ResponseMetadata"], "HTTPStatusCode", 200)
+
+    clusters = resp.get("DBClusters")
+    if not clusters:
+        LOGGER.warning("No clusters returned from the API call")
+        return ""
+    
+    # only present when RDS manages the master user password in Secrets Manager
+    return clusters[0].get("MasterUserSecret", {}).get("SecretArn", "")
+
 
-    sm_client = boto3.client("secretsmanager")
+def _fetch_managed_secret_for_db(client, cluster_arn):
+    """Fetch the arn of the RDS managed secret for the database cluster
 
-    resp = sm_client.list_secrets()
+    :param client: boto3 Client Object (Secrets Manager)
+    :param cluster_arn: String
+
+    :rtype: String
+    """
+    resp = client.list_secrets(
+        Filters=[
+            {"Key": "tag-key", "Values": [MANAGED_SECRET_TAG_KEY]},
+            {"Key": "tag-value", "Values": [cluster_arn]},
+        ]
+    )
+
+    _check_missing_field(resp, "ResponseMetadata")
+
+    _validate_field(resp["ResponseMetadata"], "HTTPStatusCode", 200)
+
+    secrets = resp.get("SecretList")
+    if not secrets:
+        return ""
+    
+    LOGGER.info("Found managed secret for the database")
+    return secrets[0]["ARN"]
+
+
+def _fetch_secret_for_db(client, cluster_identifier, cluster_arn):
+    """Fetch the secret arn, name for the database cluster
+
+    :param client: boto3 Client Object (Secrets Manager)
+    :param cluster_identifier: String
+    :param cluster_arn: String
+
+    :rtype: String
+    """
+    arn = _fetch_managed_secret_for_db(client, cluster_arn)
+    if arn:
+        return arn
+
+    LOGGER.info("No managed secret found. Will check the cluster id of every secret")
+    resp = client.list_secrets()
 
     _check_missing_field(resp, "ResponseMetadata")
 
@@ -203,25 +290,35 @@ def _fetch_secret_for_db(cluster_identifier):
 
     _check_missing_field(resp, "SecretList")
 
-    for secret in resp["SecretList"]:
-        _check_missing_field(secret, "Name")
-        cluster_id = get_db_cluster_id_from_secret_name(secret["Name"])
-        
-        if not cluster_id:
-            LOGGER.warning("No cluster ID fetched from secret name")
-            continue
-        
-        if cluster_id == cluster_identifier:
-            LOGGER.info("Found matching secret for the database")
-            _check_missing_field(secret, "ARN")
-            arn = secret["ARN"]
-            break
+    arn = ""
+    # secret values are fetched concurrently, stopping at the first match
+    with ThreadPoolExecutor(max_workers=SECRET_LOOKUP_MAX_WORKERS) as executor:
+        futures = {}
+        for secret in resp["SecretList"]:
+            _check_missing_field(secret, "Name")
+            future = executor.submit(get_db_cluster_id_from_secret_name, client, secret["Name"])
+            futures[future] = secret
+
+        for future in as_completed(futures):
+            cluster_id = future.result()
+            
+            if not cluster_id:
+                LOGGER.warning("No cluster ID fetched from secret name")
+                continue
+            
+            if cluster_id == cluster_identifier:
+                LOGGER.info("Found matching secret for the database")
+                secret = futures[future]
+                _check_missing_field(secret, "ARN")
+                arn = secret["ARN"]
+                for pending in futures:
+                    pending.cancel()
+                break
 
-    sm_client.close()
     return arn
 
 
-def _execute_sql(client, secret, dbname, resource_arn, sql):
+def _execute_sql(client, secret, dbname, resource_arn, sql, transaction_id):
     """Execute passed in SQL against RDS using the Data API
 
     :param client: RDS Data Client Object (boto3)
@@ -229,6 +326,7 @@ def _execute_sql(client, secret, dbname, resource_arn, sql):
     :param dbname: String
     :param resource_arn: String
     :param SQL: String (sql to be executed)
+    :param transaction_id: String
 
     :raises: Exception
     """
@@ -238,6 +336,7 @@ def _execute_sql(client, secret, dbname, resource_arn, sql):
         secretArn=secret,
         database=dbname,
         sql=sql,
+        transactionId=transaction_id,
         )
 
     if response["ResponseMetadata"]["HTTPStatusCode"] == 200:
@@ -248,8 +347,69 @@ def _execute_sql(client, secret, dbname, resource_arn, sql):
         raise Exception
     
 
-def _get_ddl_source_file_contents(client, bucket, filename):
-    """Fetch the contents of the DDL SQL file
+def _execute_in_transaction(client, secret, dbname, resource_arn, sql_statements):
+    """Execute the statements in one Data API transaction, rolling back on failure
+
+    :param client: RDS Data Client Object (boto3)
+    :param secret: String (ARN of the secret)
+    :param dbname: String
+    :param resource_arn: String
+    :param sql_statements: List (sql statements to be executed in order)
+
+    :raises: botocore.exceptions.ClientError
+    """
+    transaction_id = client.begin_transaction(
+        resourceArn=resource_arn,
+        secretArn=secret,
+        database=dbname,
+        )["transactionId"]
+
+    try:
+        for sql in sql_statements:
+            _execute_sql(client, secret, dbname, resource_arn, sql, transaction_id)
+    except Exception as e:
+        LOGGER.error("Rolling back DDL transaction")
+        client.rollback_transaction(
+            resourceArn=resource_arn,
+            secretArn=secret,
+            transactionId=transaction_id,
+            )
+        raise e
+
+    client.commit_transaction(
+        resourceArn=resource_arn,
+        secretArn=secret,
+        transactionId=transaction_id,
+        )
+    LOGGER.info(f"Successfully committed {len(sql_statements)} DDL statements")
+
+
+def _execute_ddl(client, secret, dbname, resource_arn, sql_statements):
+    """Execute the DDL statements in bounded transactions using the Data API
+
+    The statements are committed in chunks of DDL_TRANSACTION_MAX_STATEMENTS,
+    each of which shares one connection and is applied all-or-nothing. If a
+    statement fails, its chunk is rolled back, while the chunks committed
+    before it stay applied and the remaining statements are not run.
+
+    :param client: RDS Data Client Object (boto3)
+    :param secret: String (ARN of the secret)
+    :param dbname: String
+    :param resource_arn: String
+    :param sql_statements: Iterable (sql statements to be executed in order)
+
+    :raises: botocore.exceptions.ClientError
+    """
+    sql_statements = iter(sql_statements)
+    while True:
+        chunk = list(itertools.islice(sql_statements, DDL_TRANSACTION_MAX_STATEMENTS))
+        if not chunk:
+            return
+        _execute_in_transaction(client, secret, dbname, resource_arn, chunk)
+
+
+def _iter_ddl_statements(client, bucket, filename):
+    """Stream the DDL SQL file and yield its statements one at a time
 
     :param client: boto3 Client Object (S3)
     :param bucket: String
@@ -257,7 +417,7 @@ def _get_ddl_source_file_contents(client, bucket, filename):
 
     :raises: Exception
 
-    :rtype String
+    :rtype Iterator
     """
     resp = client.get_object(Bucket=bucket, Key=filename)
 
@@ -266,34 +426,42 @@ def _get_ddl_source_file_contents(client, bucket, filename):
     _validate_field(resp["ResponseMetadata"], "HTTPStatusCode", 200)
 
     _check_missing_field(resp, "Body")
-    body_obj = resp["Body"]
+    reader = codecs.getreader("utf-8")(resp["Body"])
     
-    return body_obj.read().decode("utf-8")
+    buf = ""
+    while True:
+        chunk = reader.read(DDL_READ_CHUNK_SIZE)
+        if not chunk:
+            break
+        buf += chunk
+        # the last piece may be an incomplete statement, keep it for the next chunk
+        *sql_statements, buf = buf.split(";")
+        for sql in sql_statements:
+            # get rid of white spaces
+            eff_sql = sql.strip(" \n\t")
+            if eff_sql:
+                yield eff_sql
+
+    eff_sql = buf.strip(" \n\t")
+    if eff_sql:
+        yield eff_sql
 
 
 def lambda_handler(event, context):
     """What executes when the program is run"""
     
-    # configure python logger for Lambda
-    _configure_logger()
-    # silence chatty libraries for better logging
-    _silence_noisy_loggers()
-    
     msg_attr = _get_sqs_message_attributes(event)
     
     if msg_attr:
         # Because messages remain in the queue
         LOGGER.info(f"Deleting message {msg_attr['message_id']} from sqs")
-        sqs_client = boto3.client("sqs")
         queue_url = os.environ.get(SQS_QUEUE_ENV_VAR)
         if not queue_url:
             raise MissingEnvironmentVariable(
                 f"{SQS_QUEUE_ENV_VAR} environment variable is required")
                 
-        deletion_resp = sqs_client.delete_message(
+        deletion_resp = SQS_CLIENT.delete_message(
             QueueUrl=queue_url, ReceiptHandle=msg_attr["receipt_handle"])
-        
-        sqs_client.close()
 
         resp_metadata = deletion_resp.get("ResponseMetadata")
         if not resp_metadata:
@@ -339,7 +507,9 @@ def lambda_handler(event, context):
         LOGGER.warning(f"{DB_NAME_ENV_VAR} environment variable will be used as dbname")
         db_name = env_db_name
 
-    secret_arn = _fetch_secret_for_db(cluster_id)
+    secret_arn = _fetch_master_user_secret_for_db(RDS_CLIENT, cluster_id)
+    if not secret_arn:
+        secret_arn = _fetch_secret_for_db(SM_CLIENT, cluster_id, cluster_arn)
     if not secret_arn:
         LOGGER.error(
             f"No matching secret found associated with the cluster: {cluster_id}. Exiting")
@@ -347,23 +517,9 @@ def lambda_handler(event, context):
 
     ddl_source_file = os.environ.get("DDL_SOURCE_FILE_RDS", DDL_FILE)
     
-    s3_client = boto3.client("s3")
-    file_content_string = _get_ddl_source_file_contents(
-        s3_client, source_s3_bucket, ddl_source_file)
-    s3_client.close()
-
-    rds_data_client = boto3.client("rds-data")
-
-    sql_statements = file_content_string.split(";")
-    for sql in sql_statements:
-        # get rid of white spaces
-        eff_sql = sql.strip(" \n\t")
-        if eff_sql:
-            _execute_sql(
-                rds_data_client, 
-                secret_arn,
-                db_name,
-                cluster_arn,
-                eff_sql)
-
-    rds_data_client.close()
\ No newline at end of file
+    _execute_ddl(
+        RDS_DATA_CLIENT, 
+        secret_arn,
+        db_name,
+        cluster_arn,
+        _iter_ddl_statements(S3_CLIENT, source_s3_bucket, ddl_source_file))
\ No newline at end of file
@@ -1,9 +1,12 @@
-import copy
+import functools
 import json
 import logging
 import os
+import re
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 import boto3
+from botocore.config import Config
 from botocore.exceptions import ClientError
 
 
@@ -18,12 +21,40 @@ DEFAULT_EXCEPTION_SCHEMAS = [
     "information_schema"
 ]
 
+# the excluded schemas are bound as parameters, one placeholder per schema
 BASE_SCHEMA_SQL = """
-SELECT DISTINCT(table_schema) FROM information_schema.tables WHERE table_schema NOT IN {}
+SELECT DISTINCT(table_schema) FROM information_schema.tables WHERE table_schema NOT IN ({})
 """
 
 LOGGER = logging.getLogger()
 
+# RDS tags the secrets it manages with the ARN of the owning cluster
+MANAGED_SECRET_TAG_KEY = "aws:rds:primaryDBClusterArn"
+
+# upper bound on concurrent secret lookups when no managed secret is found
+SECRET_LOOKUP_MAX_WORKERS = 10
+
+# only the cluster identifier is needed from each secret, so skip parsing the whole document
+CLUSTER_ID_PATTERN = re.compile(r'"dbClusterIdentifier"\s*:\s*"([^"]+)"')
+
+# upper bound on concurrent crawler creations per invocation
+MAX_WORKERS = 16
+
+# the secret lookup and crawler worker pools draw from these pooled connections
+BOTO_CONFIG = Config(
+    tcp_keepalive=True,
+    max_pool_connections=50,
+    connect_timeout=2,
+    retries={"mode": "adaptive", "max_attempts": 5},
+)
+
+GLUE_CLIENT = boto3.client("glue", config=BOTO_CONFIG)
+RDS_CLIENT = boto3.client("rds", config=BOTO_CONFIG)
+RDS_DATA_CLIENT = boto3.client("rds-data", config=BOTO_CONFIG)
+SM_CLIENT = boto3.client("secretsmanager", config=BOTO_CONFIG)
+SQS_CLIENT = boto3.client("sqs", config=BOTO_CONFIG)
+STS_CLIENT = boto3.client("sts", config=BOTO_CONFIG)
+
 
 class MalformedEvent(Exception):
     """Raised if a malformed event received"""
@@ -57,6 +88,11 @@ def _configure_logger():
         logging.basicConfig(level=level)
 
 
+# logging only needs to be set up once per execution environment
+_configure_logger()
+_silence_noisy_loggers()
+
+
 def _check_missing_field(validation_dict, extraction_key):
     """Check if a field exists in a dictionary
 
@@ -90,22 +126,27 @@ def _validate_field(validation_dict, extraction_key, expected_value):
         raise ValueError
 
 
-def _get_db_cluster_identifier(secret_name):
+@functools.lru_cache(maxsize=1)
+def _get_account_id():
+    """Fetch the account id via STS (cached, it never changes for a given function)
+
+    :rtype: String
+    """
+    return STS_CLIENT.get_caller_identity()["Account"]
+
+
+# the cluster a secret belongs to does not change, so lookups are kept across warm invocations
+@functools.lru_cache(maxsize=256)
+def _get_db_cluster_identifier(client, secret_name):
     """Return DB Cluster ID from secret
 
+    :param client: boto3 Client Object (Secrets Manager)
     :param secret_name: String
     
     :raises: botocore.exceptions.ClientError
     
     :rtype: String
     """
-    session = boto3.session.Session()
-
-    # Initializing Secret Manager's client    
-    client = session.client(
-        service_name='secretsmanager',
-            region_name=os.environ.get("AWS_REGION", session.region_name)
-        )
     LOGGER.info(f"Attempting to get secret value for: {secret_name}")
     try:
         get_secret_value_response = client.get_secret_value(
@@ -118,47 +159,75 @@ def _get_db_cluster_identifier(secret_name):
     
     _check_missing_field(get_secret_value_response, "SecretString")
     
-    try:
-        secret_dict = json.loads(get_secret_value_response["SecretString"])
-        return secret_dict.get("dbClusterIdentifier")
-    except json.decoder.JSONDecodeError:
-        LOGGER.warning("Found a non kv secret")
+    match = CLUSTER_ID_PATTERN.search(get_secret_value_response["SecretString"])
+    if not match:
+        LOGGER.warning("Secret does not contain dbClusterIdentifier")
         return
     
+    return match.group(1)
+    
 
-def _fetch_secret_for_db(cluster_identifier):
-    """Fetch the secret arn, name for the database cluster
+def _fetch_managed_secret_for_db(client, cluster_arn):
+    """Fetch the secret arn, name of the RDS managed secret for the database cluster
 
-    :param cluster_identifier: String
+    :param client: boto3 Client Object (Secrets Manager)
+    :param cluster_arn: String
 
     :rtype: Tuple<String, String>
     """
-    arn = ""
-    name = ""
-
-    sm_client = boto3.client("secretsmanager")
-
-    resp = sm_client.list_secrets()
+    resp = client.list_secrets(
+        Filters=[
+            {"Key": "tag-key", "Values": [MANAGED_SECRET_TAG_KEY]},
+            {"Key": "tag-value", "Values": [cluster_arn]},
+        ]
+    )
 
     _check_missing_field(resp, "ResponseMetadata")
 
     _validate_field(resp["ResponseMetadata"], "HTTPStatusCode", 200)
 
-    _check_missing_field(resp, "SecretList")
+    secrets = resp.get("SecretList")
+    if not secrets:
+        return "", ""
+    
+    LOGGER.info("Found managed secret for the database")
+    return secrets[0]["ARN"], secrets[0]["Name"]
 
-    for secret in resp["SecretList"]:
-        _check_missing_field(secret, "Name")
-        name = secret["Name"]
 
-        cluster_id = _get_db_cluster_identifier(name)
-        
-        if cluster_id is not None:
-            if cluster_id == cluster_identifier:
+def _fetch_secret_for_db(client, cluster_identifier, cluster_arn):
+    """Fetch the secret arn, name for the database cluster
+
+    :param client: boto3 Client Object (Secrets Manager)
+    :param cluster_identifier: String
+    :param cluster_arn: String
+
+    :rtype: Tuple<String, String>
+    """
+    arn, name = _fetch_managed_secret_for_db(client, cluster_arn)
+    if arn:
+        return arn, name
+
+    LOGGER.info("No managed secret found. Will check the cluster id of every secret")
+    # secret values are fetched concurrently, stopping at the first match
+    with ThreadPoolExecutor(max_workers=SECRET_LOOKUP_MAX_WORKERS) as executor:
+        futures = {}
+        for page in client.get_paginator("list_secrets").paginate():
+            for secret in page.get("SecretList", []):
+                _check_missing_field(secret, "Name")
+                future = executor.submit(_get_db_cluster_identifier, client, secret["Name"])
+                futures[future] = secret
+
+        for future in as_completed(futures):
+            if future.result() == cluster_identifier:
                 LOGGER.info("Found matching secret for the database")
+                secret = futures[future]
                 _check_missing_field(secret, "ARN")
                 arn = secret["ARN"]
+                name = secret["Name"]
+                for pending in futures:
+                    pending.cancel()
+                break
 
-    sm_client.close()
     return arn, name
 
 
@@ -209,16 +278,17 @@ def create_glue_conn(client,
     _validate_field(resp["ResponseMetadata"], "HTTPStatusCode", 200)
 
 
-def get_subnet_for_conn(subnet_group):
+# subnet groups rarely change, so lookups are kept across warm invocations
+@functools.lru_cache(maxsize=64)
+def get_subnet_for_conn(client, subnet_group):
     """Fetch a subnet for the connection
     
+    :param client: Boto3 client object (RDS)
     :param subnet_group: String
     
     :rtype: Dictionary
     """
-    rds_client = boto3.client("rds")
-    resp = rds_client.describe_db_subnet_groups(DBSubnetGroupName=subnet_group)
-    rds_client.close()
+    resp = client.describe_db_subnet_groups(DBSubnetGroupName=subnet_group)
 
     _check_missing_field(resp, "ResponseMetadata")
     _validate_field(resp["ResponseMetadata"], "HTTPStatusCode", 200)
@@ -232,6 +302,35 @@ def get_subnet_for_conn(subnet_group):
     return subnets[0]
 
 
+def create_crawler(schema, client, cluster_id, connection_name, catalog_db_name, crawler_role):
+    """Create a crawler for a database schema
+    
+    :param schema: String
+    :param client: Boto3 client object (Glue)
+    :param cluster_id: String
+    :param connection_name: String
+    :param catalog_db_name: String
+    :param crawler_role: String
+    """
+    crawler_name = f"glue-crawler-{cluster_id}-{schema}"
+    LOGGER.info(f"Creating crawler: {crawler_name}")
+    resp = client.create_crawler(
+        Name=crawler_name,
+        Role=crawler_role,
+        DatabaseName=catalog_db_name,
+        Targets={
+        "JdbcTargets": [
+            {
+                "ConnectionName": connection_name,
+                "Path": f"postgres/{schema}/%",
+            },],
+            },
+        Schedule='cron(0 2 * * ? *)',
+        )
+    _check_missing_field(resp, "ResponseMetadata")
+    _validate_field(resp["ResponseMetadata"], "HTTPStatusCode", 200)
+
+
 def _get_sqs_message_attributes(event):
     """Extract receiptHandle from message
     
@@ -303,7 +402,7 @@ def _get_message_body(event):
             raise MalformedEvent("'body' is not valid JSON")
 
 
-def _execute_sql(client, secret, dbname, resource_arn, sql):
+def _execute_sql(client, secret, dbname, resource_arn, sql, parameters):
     """Execute passed in SQL against RDS using the Data API
 
     :param client: RDS Data Client Object (boto3)
@@ -311,6 +410,7 @@ def _execute_sql(client, secret, dbname, resource_arn, sql):
     :param dbname: String
     :param resource_arn: String
     :param SQL: String (sql to be executed)
+    :param parameters: List (Data API SqlParameter objects)
 
     :raises: Exception
 
@@ -322,6 +422,7 @@ def _execute_sql(client, secret, dbname, resource_arn, sql):
         secretArn=secret,
         database=dbname,
         sql=sql,
+        parameters=parameters,
         )
     if response["ResponseMetadata"]["HTTPStatusCode"] == 200:
         LOGGER.info("Successfully executed SQL statement")
@@ -333,11 +434,6 @@ def _execute_sql(client, secret, dbname, resource_arn, sql):
 
 def lambda_handler(event, context):
     """What executes when the program is run"""
-    
-    # configure python logger
-    _configure_logger()
-    # silence chatty libraries
-    _silence_noisy_loggers()
 
     msg_attr = _get_sqs_message_attributes(event)
     
@@ -349,11 +445,8 @@ def lambda_handler(event, context):
             raise MissingEnvironmentVariable(
                 f"{SQS_QUEUE_URL_ENV_VAR} environment variable is required")
         
-        sqs_client = boto3.client("sqs")
-        deletion_resp = sqs_client.delete_message(
+        deletion_resp = SQS_CLIENT.delete_message(
             QueueUrl=queue_url, ReceiptHandle=msg_attr["receipt_handle"])
-        
-        sqs_client.close()
 
         resp_metadata = deletion_resp.get("ResponseMetadata")
         if not resp_metadata:
@@ -397,7 +490,7 @@ def lambda_handler(event, context):
     else:
         protocol = "mysql"
 
-    secret_arn, secret_name = _fetch_secret_for_db(cluster_id)
+    secret_arn, secret_name = _fetch_secret_for_db(SM_CLIENT, cluster_id, cluster_arn)
 
     if not secret_arn:
         LOGGER.error(
@@ -413,17 +506,15 @@ def lambda_handler(event, context):
     subnet_group = body['dBSubnetGroup']
     LOGGER.info(f"Subnet Group Name: {subnet_group}")
     
-    subnet = get_subnet_for_conn(subnet_group)
+    subnet = get_subnet_for_conn(RDS_CLIENT, subnet_group)
     LOGGER.info(f"Subnet ID: {subnet['SubnetIdentifier']}")
     
-    LOGGER.info("fetching account id via API call")
-    account_id = boto3.client("sts").get_caller_identity()["Account"]
+    account_id = _get_account_id()
 
     connection_name =  f"glue-connection-{cluster_id}"
-    glue_client = boto3.client("glue")
     LOGGER.info(f"Creating glue connection object: {connection_name}")
     create_glue_conn(
-        client=glue_client,
+        client=GLUE_CLIENT,
         connection_name=connection_name,
         protocol=protocol,
         endpoint=endpoint,
@@ -436,22 +527,20 @@ def lambda_handler(event, context):
         sec_group_id=sec_group_id
         )
 
-    exc_schemas = copy.deepcopy(DEFAULT_EXCEPTION_SCHEMAS)
+    # the schema names are strings, a shallow copy is enough
+    exc_schemas = list(DEFAULT_EXCEPTION_SCHEMAS)
     crawler_schemas_exc = os.environ.get(CRAWLER_SCHEMAS_EXC_ENV_VAR)
     if crawler_schemas_exc is not None:
-        for exc_schema in crawler_schemas_exc.split(","):
-            exc_schemas.append(exc_schema)
-
-    rds_data_client = boto3.client("rds-data")
+        exc_schemas.extend(crawler_schemas_exc.split(","))
 
     sql_resp = _execute_sql(
-        rds_data_client, 
+        RDS_DATA_CLIENT, 
         secret_arn,
         dbname,
         cluster_arn,
-        BASE_SCHEMA_SQL.format(tuple(exc_schemas))
+        BASE_SCHEMA_SQL.format(", ".join(f":schema{i}" for i in range(len(exc_schemas)))),
+        [{"name": f"schema{i}", "value": {"stringValue": schema}} for i, schema in enumerate(exc_schemas)],
         )
-    rds_data_client.close()
     
     crawler_schemas = []
     recs = sql_resp.get("records", [])
@@ -479,23 +568,20 @@ def lambda_handler(event, context):
         raise MissingEnvironmentVariable(
             f"{CRAWLER_ROLE_ENV_VAR} environment variable is required")
     
-    for schema in crawler_schemas:
-        crawler_name = f"glue-crawler-{cluster_id}-{schema}"
-        LOGGER.info(f"Creating crawler: {crawler_name}")
-        resp = glue_client.create_crawler(
-            Name=crawler_name,
-            Role=crawler_role,
-            DatabaseName=catalog_db_name,
-            Targets={
-            "JdbcTargets": [
-                {
-                    "ConnectionName": connection_name,
-                    "Path": f"postgres/{schema}/%",
-                },],
-                },
-            Schedule='cron(0 2 * * ? *)',
-            )
-        _check_missing_field(resp, "ResponseMetadata")
-        _validate_field(resp["ResponseMetadata"], "HTTPStatusCode", 200)
-        
-    glue_client.close()    
+    if not crawler_schemas:
+        LOGGER.warning("No schemas to crawl. Exiting.")
+        return
+
+    create_schema_crawler = functools.partial(
+        create_crawler,
+        client=GLUE_CLIENT,
+        cluster_id=cluster_id,
+        connection_name=connection_name,
+        catalog_db_name=catalog_db_name,
+        crawler_role=crawler_role,
+    )
+    # crawler creation is network bound, so the schemas are processed concurrently
+    max_workers = min(MAX_WORKERS, len(crawler_schemas))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # consuming the results re-raises any exception from the workers
+        list(executor.map(create_schema_crawler, crawler_schemas))
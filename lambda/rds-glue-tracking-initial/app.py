@@ -4,6 +4,7 @@ import uuid
 
 import boto3
 from boto3.dynamodb.types import TypeSerializer
+from botocore.config import Config
 from botocore.exceptions import ClientError
 
 
@@ -12,6 +13,21 @@ CATALOG_DB_NAME_ENV_VAR = "CATALOG_DB_NAME"
 
 LOGGER = logging.getLogger()
 
+# short timeouts so a stalled tracker write is retried instead of holding
+# the invocation
+BOTO_CONFIG = Config(
+    tcp_keepalive=True,
+    max_pool_connections=50,
+    connect_timeout=2,
+    read_timeout=10,
+    retries={"mode": "adaptive", "max_attempts": 5},
+)
+
+# stateless, so a single instance serves every invocation
+SERIALIZER = TypeSerializer()
+
+DDB_CLIENT = boto3.client("dynamodb", config=BOTO_CONFIG)
+
 
 class MalformedEvent(Exception):
     """Raised if a malformed event received"""
@@ -43,7 +59,12 @@ def _configure_logger():
         logging.getLogger().setLevel(level)
     else:
         logging.basicConfig(level=level)
-        
+
+
+# logging only needs to be set up once per execution environment
+_configure_logger()
+_silence_noisy_loggers()
+
 
 def _check_missing_field(validation_dict, extraction_key):
     """Check if a field exists in a dictionary
@@ -104,11 +125,6 @@ def _extract_valid_event(event):
 
 def lambda_handler(event, context):
     """What executes when the program is run"""
-    
-    # configure python logger for Lambda
-    _configure_logger()
-    # silence chatty libraries for better logging
-    _silence_noisy_loggers()
 
     catalog_db_name = os.environ.get(CATALOG_DB_NAME_ENV_VAR)
     if not catalog_db_name:
@@ -130,7 +146,8 @@ def lambda_handler(event, context):
     _check_missing_field(valid_event, "tableInput")
     table_input = valid_event["tableInput"]
 
-    unique_id = uuid.uuid4()
+    # derived from the catalog table, so a redelivered CreateTable event fails the condition below
+    unique_id = uuid.uuid5(uuid.NAMESPACE_URL, f"{valid_event['databaseName']}/{table_input['name']}")
 
     data_source_attrs = {}
     if table_input.get("parameters"):
@@ -146,22 +163,18 @@ def lambda_handler(event, context):
         "data_catalog_entry": True,
         "data_source_attrs": data_source_attrs,
     }
-    serializer = TypeSerializer()
-    ddb_client = boto3.client("dynamodb")
     try:
-        resp = ddb_client.put_item(
+        resp = DDB_CLIENT.put_item(
             TableName=ddb_table_name,
             Item={
-                k: serializer.serialize(v) for k, v in python_obj.items()
+                k: SERIALIZER.serialize(v) for k, v in python_obj.items()
                 },
             ConditionExpression="attribute_not_exists(id)",
         )
         LOGGER.info("Successfully initialized item in Glue Tracker DynamoDB")
     except ClientError as e:
         if e.response["Error"]["Code"] == "ConditionalCheckFailedException":
-            LOGGER.error(f"An entry with primary key: {unique_id} already exists")
+            LOGGER.warning(f"An entry with primary key: {unique_id} already exists")
         else:
             LOGGER.error("Unable to ")
             raise Exception
-
-    ddb_client.close()
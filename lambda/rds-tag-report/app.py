@@ -1,20 +1,51 @@
 import datetime
+import functools
 import logging
 import os
+import re
 import uuid
 
 import boto3
-from boto3.dynamodb.types import TypeDeserializer, TypeSerializer
+from boto3.dynamodb.types import TypeDeserializer
+from botocore.config import Config
 
 
 LOGGER = logging.getLogger()
 
-DDB_PARTIQL = "SELECT * FROM {} WHERE data_catalog_entry = True AND data_source_type = 'rds'"
+DDB_FILTER = "data_catalog_entry = :catalog_entry AND data_source_type = :source_type"
+DDB_FILTER_VALUES = {
+    ":catalog_entry": {"BOOL": True},
+    ":source_type": {"S": "rds"},
+}
+# only the attributes the handler reads are returned by the scan
+DDB_PROJECTION = "data_source_attrs.connectionName, data_catalog_table_name"
 
 GLUE_TRACKER_DDB_TABLE_NAME_ENV_VAR = "DDB_GLUE_TRACKER_TABLE_NAME"
 DDB_TAG_TABLE_NAME_ENV_VAR = "TAG_REPORT_TABLE_NAME"
 
-REQUIRED_TAG_KEYS = ["APP_ID", "Purpose of Processing", "Data Subjects", "APP_NAME", "Business Function", "Processing Activity"]
+# the cluster id is the first label of the host, e.g. jdbc:postgresql://<cluster id>.cluster-xxx.rds.amazonaws.com:5432/db
+JDBC_CLUSTER_ID_PATTERN = re.compile(r"://([^.]+)\.")
+
+REQUIRED_TAG_KEYS = frozenset({"APP_ID", "Purpose of Processing", "Data Subjects", "APP_NAME", "Business Function", "Processing Activity"})
+
+# short timeouts so a stalled tagging call is retried instead of holding
+# the invocation
+BOTO_CONFIG = Config(
+    tcp_keepalive=True,
+    max_pool_connections=50,
+    connect_timeout=2,
+    read_timeout=10,
+    retries={"mode": "adaptive", "max_attempts": 5},
+)
+
+# stateless, so a single instance serves every invocation
+DESERIALIZER = TypeDeserializer()
+
+DDB_CLIENT = boto3.client("dynamodb", config=BOTO_CONFIG)
+DDB_RESOURCE = boto3.resource("dynamodb", config=BOTO_CONFIG)
+GLUE_CLIENT = boto3.client("glue", config=BOTO_CONFIG)
+RDS_CLIENT = boto3.client("rds", config=BOTO_CONFIG)
+STS_CLIENT = boto3.client("sts", config=BOTO_CONFIG)
 
 
 class MalformedEvent(Exception):
@@ -49,6 +80,11 @@ def _configure_logger():
         logging.basicConfig(level=level)
 
 
+# logging only needs to be set up once per execution environment
+_configure_logger()
+_silence_noisy_loggers()
+
+
 def _check_missing_field(validation_dict, extraction_key):
     """Check if a field exists in a dictionary
 
@@ -80,46 +116,66 @@ def _validate_field(validation_dict, extraction_key, expected_value):
     if extracted_value != expected_value:
         LOGGER.error(f"Incorrect value found for '{extraction_key}' field")
         raise ValueError
-    
 
-def _fetch_ddb_results(client, query):
-    """Fetch results from PartiQL DynamoDB query
 
-    :param client: Boto3 client (DynamoDB)
-    :param query: String
+@functools.lru_cache(maxsize=1)
+def _get_account_id():
+    """Fetch the account id via STS (cached, it never changes for a given function)
 
-    :rtype: List
+    :rtype: String
     """
-    resp = client.execute_statement(Statement=query)
+    return STS_CLIENT.get_caller_identity()["Account"]
+    
 
-    _check_missing_field(resp, "ResponseMetadata")
+def _fetch_ddb_results(client, table_name):
+    """Scan a DynamoDB table for the tracked RDS data sources
 
-    _validate_field(resp["ResponseMetadata"], "HTTPStatusCode", 200)
+    :param client: Boto3 client (DynamoDB)
+    :param table_name: String
 
-    return resp
+    :rtype: Generator
+    """
+    paginator = client.get_paginator("scan")
+    # scans return at most 1MB per page, the items are handed out as each page arrives
+    for page in paginator.paginate(
+        TableName=table_name,
+        FilterExpression=DDB_FILTER,
+        ExpressionAttributeValues=DDB_FILTER_VALUES,
+        ProjectionExpression=DDB_PROJECTION,
+    ):
+        yield from page.get("Items", [])
 
 
 def unmarshall_ddb_items(ddb_items):
     """Deserialize ddb_items
 
-    :param ddb_items: List
+    :param ddb_items: Iterable
 
-    :rtype: List
+    :rtype: Generator
     """
-    unmarshalled = []
+    for ddb_item in ddb_items:
+        yield {k: DESERIALIZER.deserialize(v) for k, v in ddb_item.items()}
 
-    deserializer = TypeDeserializer()
 
-    for ddb_item in ddb_items:
-        unmarshalled.append(
-            {k: deserializer.deserialize(v) for k, v in ddb_item.items()}
-        )
+@functools.lru_cache(maxsize=128)
+def get_db_cluster_arn(client, cluster_id):
+    """Fetch the ARN of the database cluster (cached for the current invocation)
+    
+    :param client: Boto3 client object (RDS)
+    :param cluster_id: String
+    
+    :rtype: String
+    """
+    resp = client.describe_db_clusters(DBClusterIdentifier=cluster_id)
+    _check_missing_field(resp, "ResponseMetadata")
+    _validate_field(resp["ResponseMetadata"], "HTTPStatusCode", 200)
     
-    return unmarshalled
+    return resp["DBClusters"][0]["DBClusterArn"]
 
 
+@functools.lru_cache(maxsize=128)
 def get_db_tags(client, table_arn):
-    """Fetch tags for dynamodb table
+    """Fetch tags for the database cluster (cached for the current invocation)
     
     :param client: Boto3 client object
     :param table_arn: String
@@ -138,8 +194,9 @@ def get_db_tags(client, table_arn):
         return tags
         
 
+@functools.lru_cache(maxsize=128)
 def get_glue_connection(client, connection_name):
-    """Get glue connection data
+    """Get glue connection data (cached for the current invocation)
     
     :param client: Boto3 client object
     :param connection_name: String
@@ -147,7 +204,7 @@ def get_glue_connection(client, connection_name):
     :rtype: 
     """
     resp = client.get_connection(
-        CatalogId=boto3.client("sts").get_caller_identity()["Account"],
+        CatalogId=_get_account_id(),
         Name=connection_name
         )
     _check_missing_field(resp, "ResponseMetadata")
@@ -160,10 +217,10 @@ def get_glue_connection(client, connection_name):
 def lambda_handler(event, context):
     """What executes when the program is run"""
     
-    # configure python logger
-    _configure_logger()
-    # silence chatty libraries
-    _silence_noisy_loggers()
+    # many tables share a connection and a cluster, but both can be edited between report runs
+    get_glue_connection.cache_clear()
+    get_db_cluster_arn.cache_clear()
+    get_db_tags.cache_clear()
 
     ddb_table_name = os.environ.get(GLUE_TRACKER_DDB_TABLE_NAME_ENV_VAR)
     if not ddb_table_name:
@@ -173,74 +230,58 @@ def lambda_handler(event, context):
     if not tag_table_name:
         raise MissingEnvironmentVariable(f"{DDB_TAG_TABLE_NAME_ENV_VAR} is missing")
     
-    ddb_client = boto3.client("dynamodb")
-
-    ddb_resp = _fetch_ddb_results(
-        ddb_client, 
-        DDB_PARTIQL.format(ddb_table_name),
-    )
-
-    ddb_results = ddb_resp.get("Items")
-    if not ddb_results:
-        LOGGER.warning("No data sources fetched. Exiting.")
-        return
-
-    pythonic_results = unmarshall_ddb_items(ddb_results) 
-
-    glue_client = boto3.client("glue")
-    rds_client = boto3.client("rds")
-
-    for obj in pythonic_results:
-        jdbc_conn_name = obj["data_source_attrs"]["connectionName"]
-        LOGGER.info(f"JDBC Connection Name: {jdbc_conn_name}")
-        
-        conn_obj = get_glue_connection(glue_client, jdbc_conn_name)
-        _check_missing_field(conn_obj, "ConnectionProperties")
-        _check_missing_field(conn_obj["ConnectionProperties"], "JDBC_CONNECTION_URL")
+    # data sources are processed while the scan is still paging through the tracker table
+    pythonic_results = unmarshall_ddb_items(_fetch_ddb_results(DDB_CLIENT, ddb_table_name))
+    fetched = 0
+
+    tag_table = DDB_RESOURCE.Table(tag_table_name)
+
+    # every row of this report run shares the same timestamp
+    time_stamp = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+    # the batch writer buffers the items into BatchWriteItem requests of up to 25
+    # and resends any unprocessed items; duplicate tracker rows map to the same id,
+    # so a buffered item is replaced rather than sent twice in one request
+    with tag_table.batch_writer(overwrite_by_pkeys=["id"]) as batch:
+        for obj in pythonic_results:
+            fetched += 1
+            jdbc_conn_name = obj["data_source_attrs"]["connectionName"]
+            LOGGER.info("JDBC Connection Name: %s", jdbc_conn_name)
         
-        conn_url = conn_obj["ConnectionProperties"]["JDBC_CONNECTION_URL"]
+            conn_obj = get_glue_connection(GLUE_CLIENT, jdbc_conn_name)
+            _check_missing_field(conn_obj, "ConnectionProperties")
+            _check_missing_field(conn_obj["ConnectionProperties"], "JDBC_CONNECTION_URL")
         
-        desc_db_resp = rds_client.describe_db_clusters(
-            DBClusterIdentifier=conn_url.split("://")[1].split(".")[0]
-        )
-        _check_missing_field(desc_db_resp, "ResponseMetadata")
-        _validate_field(desc_db_resp["ResponseMetadata"], "HTTPStatusCode", 200)
+            conn_url = conn_obj["ConnectionProperties"]["JDBC_CONNECTION_URL"]
         
-        db_cluster_arn = desc_db_resp["DBClusters"][0]["DBClusterArn"]
-        LOGGER.info(f"DB Cluster ARN: {db_cluster_arn}")
+            cluster_id_match = JDBC_CLUSTER_ID_PATTERN.search(conn_url)
+            if not cluster_id_match:
+                LOGGER.error("No cluster id found in '%s'. Skipping.", conn_url)
+                continue
         
-        db_cluster_tags = get_db_tags(rds_client, db_cluster_arn)
-        if not db_cluster_tags:
-            LOGGER.error(f"'{db_cluster_arn}' does not have any tags. Skipping.")
-            continue
+            db_cluster_arn = get_db_cluster_arn(RDS_CLIENT, cluster_id_match.group(1))
+            LOGGER.info("DB Cluster ARN: %s", db_cluster_arn)
         
-        data_catalog_table_name = obj["data_catalog_table_name"]
-        LOGGER.info(f"Data catalog table name: {data_catalog_table_name}")
+            db_cluster_tags = get_db_tags(RDS_CLIENT, db_cluster_arn)
+            if not db_cluster_tags:
+                LOGGER.error("'%s' does not have any tags. Skipping.", db_cluster_arn)
+                continue
         
-        tag_obj = {}
+            data_catalog_table_name = obj["data_catalog_table_name"]
+            LOGGER.info("Data catalog table name: %s", data_catalog_table_name)
         
-        for tag in db_cluster_tags:
-            if tag["Key"] in REQUIRED_TAG_KEYS:
-                tag_obj[tag["Key"]] = tag["Value"]
-
-        if not tag_obj:
-            LOGGER.error("None of the required tags are present. Skipping.")
-            continue
-        else:
-            LOGGER.info("Attempting to update tag reporting table")
-            tag_obj["id"] = str(uuid.uuid4())
-            tag_obj["data_catalog_table_name"] = data_catalog_table_name
-            tag_obj["time_stamp"] = datetime.datetime.strftime(datetime.datetime.now(), '%Y-%m-%d %H:%M:%S')
-            serializer = TypeSerializer()
-            resp = ddb_client.put_item(
-                TableName="tagCaptureTable",
-                Item={
-                    k: serializer.serialize(v) for k, v in tag_obj.items()
-                    },
-            )
-            _check_missing_field(resp, "ResponseMetadata")
-            _validate_field(resp["ResponseMetadata"], "HTTPStatusCode", 200)
-
-    ddb_client.close()
-    rds_client.close()
-    glue_client.close()
+            tag_obj = {tag["Key"]: tag["Value"] for tag in db_cluster_tags if tag["Key"] in REQUIRED_TAG_KEYS}
+
+            if not tag_obj:
+                LOGGER.error("None of the required tags are present. Skipping.")
+                continue
+            else:
+                LOGGER.info("Queueing tag reporting table update")
+                # one row per table and run, resending a row overwrites it instead of duplicating it
+                tag_obj["id"] = str(uuid.uuid5(uuid.NAMESPACE_URL, f"{data_catalog_table_name}/{time_stamp}"))
+                tag_obj["data_catalog_table_name"] = data_catalog_table_name
+                tag_obj["time_stamp"] = time_stamp
+                batch.put_item(Item=tag_obj)
+
+    if not fetched:
+        LOGGER.warning("No data sources fetched.")
@@ -1,9 +1,11 @@
-import copy
+import functools
 import logging
 import os
+from concurrent.futures import ThreadPoolExecutor
 
 import boto3
-from boto3.dynamodb.types import TypeDeserializer
+from botocore.config import Config
+from botocore.exceptions import ClientError
 
 
 LOGGER = logging.getLogger()
@@ -18,7 +20,7 @@ GLUE_DEFAULT_ARGS = {
             "--job-language": "python",
         }
 
-DDB_PARTIQL = "SELECT * FROM {} WHERE glue_job_created = False AND data_catalog_entry = True AND data_source_type = 's3'"
+DDB_PARTIQL = "SELECT id, data_source_attrs, data_catalog_table_name, data_catalog_db_name FROM {} WHERE glue_job_created = False AND data_catalog_entry = True AND data_source_type = 's3'"
 
 GLUE_TRACKER_DDB_TABLE_NAME_ENV_VAR = "DDB_GLUE_TRACKER_TABLE_NAME"
 
@@ -41,10 +43,19 @@ GLUE_JOB_VERSION = "4.0"
 GLUE_JOB_EXEC_CLASS = "STANDARD"
 GLUE_JOB_MAX_CONCURRENT_RUNS = 1
 
+# upper bound on concurrent S3 sources processed per invocation
+MAX_WORKERS = 16
+
+# the per-source workers share these pooled Glue and DynamoDB connections
+BOTO_CONFIG = Config(
+    tcp_keepalive=True,
+    max_pool_connections=50,
+    retries={"mode": "adaptive", "max_attempts": 10},
+)
+
+DDB_CLIENT = boto3.client("dynamodb", config=BOTO_CONFIG)
+GLUE_CLIENT = boto3.client("glue", config=BOTO_CONFIG)
 
-class MalformedEvent(Exception):
-    """Raised if a malformed event received"""
-    
 
 class MissingEnvironmentVariable(Exception):
     """Raised if a required environment variable is missing"""
@@ -74,38 +85,33 @@ def _configure_logger():
         logging.basicConfig(level=level)
 
 
-def _check_missing_field(validation_dict, extraction_key):
-    """Check if a field exists in a dictionary
+# logging and environment only need to be set up once per execution environment
+_configure_logger()
+_silence_noisy_loggers()
 
-    :param validation_dict: Dictionary
-    :param extraction_key: String
+GLUE_TRACKER_DDB_TABLE_NAME = os.environ.get(GLUE_TRACKER_DDB_TABLE_NAME_ENV_VAR)
+if not GLUE_TRACKER_DDB_TABLE_NAME:
+    raise MissingEnvironmentVariable(f"{GLUE_TRACKER_DDB_TABLE_NAME_ENV_VAR} is missing")
 
-    :raises: MalformedEvent
-    """
-    extracted_value = validation_dict.get(extraction_key)
-    
-    if not extracted_value:
-        LOGGER.error(f"Missing '{extraction_key}' field in the event")
-        raise MalformedEvent
-    
+PII_OUTPUT_DDB_TABLE_NAME = os.environ.get(PII_OUTPUT_DDB_TABLE_NAME_ENV_VAR)
+if not PII_OUTPUT_DDB_TABLE_NAME:
+    raise MissingEnvironmentVariable(f"{PII_OUTPUT_DDB_TABLE_NAME_ENV_VAR} is missing")
 
-def _validate_field(validation_dict, extraction_key, expected_value):
-    """Validate the passed in field
+GLUE_ASSETS_BUCKET = os.environ.get(GLUE_ASSETS_ENV_VAR)
+if not GLUE_ASSETS_BUCKET:
+    raise MissingEnvironmentVariable(f"{GLUE_ASSETS_ENV_VAR} is missing")
 
-    :param validation_dict: Dictionary
-    :param extraction_key: String
-    :param expected_value: String
+GLUE_SCRIPT_BUCKET = os.environ.get(GLUE_SCRIPT_ENV_VAR)
+if not GLUE_SCRIPT_BUCKET:
+    raise MissingEnvironmentVariable(f"{GLUE_SCRIPT_ENV_VAR} is missing")
 
-    :raises: ValueError
-    """
-    extracted_value = validation_dict.get(extraction_key)
+GLUE_ROLE_ARN = os.environ.get(GLUE_ROLE_ARN_ENV_VAR)
+if not GLUE_ROLE_ARN:
+    raise MissingEnvironmentVariable(f"{GLUE_ROLE_ARN_ENV_VAR} is missing")
+
+# used for sources whose bucket configuration does not record a region
+REGION = os.environ.get("AWS_REGION", "noregion")
 
-    _check_missing_field(validation_dict, extraction_key)
-    
-    if extracted_value != expected_value:
-        LOGGER.error(f"Incorrect value found for '{extraction_key}' field")
-        raise ValueError
-    
 
 def _fetch_ddb_results(client, query):
     """Fetch results from PartiQL DynamoDB query
@@ -113,57 +119,69 @@ def _fetch_ddb_results(client, query):
     :param client: Boto3 client (DynamoDB)
     :param query: String
 
-    :rtype: Dictionary
+    :rtype: List
     """
-    resp = client.execute_statement(Statement=query)
+    items = []
+    statement_kwargs = {"Statement": query}
 
-    _check_missing_field(resp, "ResponseMetadata")
+    while True:
+        resp = client.execute_statement(**statement_kwargs)
 
-    _validate_field(resp["ResponseMetadata"], "HTTPStatusCode", 200)
+        items.extend(resp.get("Items", []))
 
-    return resp
+        # results are paginated at 1MB
+        next_token = resp.get("NextToken")
+        if not next_token:
+            return items
+        statement_kwargs["NextToken"] = next_token
 
 
-def unmarshall_ddb_items(ddb_items):
-    """Deserialize ddb_items
+def update_ddb(client, table_name, item_key):
+    """Mark the tracker entry as having its glue job, unless another execution already did
 
-    :param ddb_items: List
+    :param client: Boto3 Client Object
+    :param table_name: String
+    :param item_key: Dictionary (DynamoDB AttributeValue key)
 
-    :rtype: List
+    :rtype: Boolean (False if another execution already marked the entry)
     """
-    unmarshalled = []
+    try:
+        client.update_item(
+            TableName=table_name,
+            Key=item_key,
+            UpdateExpression="SET #glue_job_created = :true",
+            ConditionExpression="#glue_job_created = :false",
+            ExpressionAttributeNames={
+                "#glue_job_created": "glue_job_created",
+            },
+            ExpressionAttributeValues={
+                ":true": {"BOOL": True},
+                ":false": {"BOOL": False},
+            }
+        )
+    except ClientError as e:
+        if e.response["Error"]["Code"] == "ConditionalCheckFailedException":
+            return False
+        raise e
+    LOGGER.info("Successfully updated DynamoDB item")
+    return True
 
-    deserializer = TypeDeserializer()
 
-    for ddb_item in ddb_items:
-        unmarshalled.append(
-            {k: deserializer.deserialize(v) for k, v in ddb_item.items()}
-        )
-    
-    return unmarshalled
+def _create_if_missing(create_fn, **kwargs):
+    """Call a Glue create API, treating an already existing resource as created
 
+    This lets a retry finish the resources that a partially failed run left behind.
 
-def update_ddb(client, table_name, obj):
-    """Update the dynamodb entry in the tracker table
+    :param create_fn: Boto3 client method (Glue create_*)
 
-    :param client: Boto3 Client Object
-    :param table_name: String
-    :param obj: Dictionary
+    :raises: botocore.exceptions.ClientError
     """
-    resp = client.update_item(
-        TableName=table_name,
-        Key={"id": {"S": obj["id"]}},
-        UpdateExpression="SET #glue_job_created = :true",
-        ExpressionAttributeNames={
-            "#glue_job_created": "glue_job_created",
-        },
-        ExpressionAttributeValues={
-            ":true": {"BOOL": True},
-        }
-    )
-    _check_missing_field(resp, "ResponseMetadata")
-    _validate_field(resp["ResponseMetadata"], "HTTPStatusCode", 200)
-    LOGGER.info("Successfully updated DynamoDB item")
+    try:
+        create_fn(**kwargs)
+    except ClientError as e:
+        if e.response["Error"]["Code"] != "AlreadyExistsException":
+            raise e
+        LOGGER.warning(f"Glue resource already exists: {kwargs['Name']}")
 
 
 def create_glue_job(
@@ -195,18 +213,21 @@ def create_glue_job(
     :param region: String
     :param glue_job_name: String
     """
-    glue_args = copy.deepcopy(GLUE_DEFAULT_ARGS)
-
-    glue_args["--spark-event-logs-path"] = spark_logs_path
-    glue_args["--TempDir"] = temp_dir
-    glue_args["--s3Bucket"] = bucket_name
-    glue_args["--dataCatalogTable"] = dc_table_name
-    glue_args["--dataCatalogDatabase"] = dc_db_name
-    glue_args["--outputTable"] = output_table
-    glue_args["--s3Host"] = s3_host
-    glue_args["--region"] = region
-
-    resp = client.create_job(
+    # the defaults are flat str -> str, so unpacking them copies them
+    glue_args = {
+        **GLUE_DEFAULT_ARGS,
+        "--spark-event-logs-path": spark_logs_path,
+        "--TempDir": temp_dir,
+        "--s3Bucket": bucket_name,
+        "--dataCatalogTable": dc_table_name,
+        "--dataCatalogDatabase": dc_db_name,
+        "--outputTable": output_table,
+        "--s3Host": s3_host,
+        "--region": region,
+    }
+
+    _create_if_missing(
+        client.create_job,
         Name=glue_job_name,
         Command={
             "Name": GLUE_JOB_TYPE_NAME,
@@ -225,120 +246,110 @@ def create_glue_job(
             "MaxConcurrentRuns": GLUE_JOB_MAX_CONCURRENT_RUNS
             }
     )
-    _check_missing_field(resp, "ResponseMetadata")
-
-    _validate_field(resp["ResponseMetadata"], "HTTPStatusCode", 200)
 
     LOGGER.info(f"Successfully created glue job: {glue_job_name}")
 
-   
-def lambda_handler(event, context):
-    """What executes when the program is run"""
+
+def _process_source(
+        s3_obj,
+        ddb_table_name,
+        output_table,
+        script_location,
+        spark_logs_path,
+        temp_dir,
+        role_arn
+        ):
+    """Create the glue job, workflow and trigger for an S3 source
+
+    :param s3_obj: Dictionary (DynamoDB AttributeValue item)
+    :param ddb_table_name: String
+    :param output_table: String
+    :param script_location: String
+    :param spark_logs_path: String
+    :param temp_dir: String
+    :param role_arn: String
+    """
+    source_attrs = s3_obj["data_source_attrs"]["M"]
+    bucket_name = source_attrs["bucketName"]["S"]
+    LOGGER.info(f"Attempting to create glue job for s3 source: {bucket_name}")
+    
+    data_catalog_table_name = s3_obj["data_catalog_table_name"]["S"]
+    LOGGER.info(f"Glue Data Catalog Table Name: {data_catalog_table_name}")
     
-    # configure python logger
-    _configure_logger()
-    # silence chatty libraries
-    _silence_noisy_loggers()
-
-    ddb_table_name = os.environ.get(GLUE_TRACKER_DDB_TABLE_NAME_ENV_VAR)
-    if not ddb_table_name:
-        raise MissingEnvironmentVariable(f"{GLUE_TRACKER_DDB_TABLE_NAME_ENV_VAR} is missing")
-        
-    ddb_client = boto3.client("dynamodb")
-
-    ddb_resp = _fetch_ddb_results(
-        ddb_client, 
-        DDB_PARTIQL.format(ddb_table_name),
+    data_catalog_db_name = s3_obj["data_catalog_db_name"]["S"]
+    LOGGER.info(f"Glue Data Catalog Database Name: {data_catalog_db_name}")
+    try:
+        region = source_attrs["CreateBucketConfiguration"]["M"]["LocationConstraint"]["S"]
+    except KeyError:
+        LOGGER.warning("'CreateBucketConfiguration' not found in data source attrs")
+        region = REGION
+    glue_job_name = f"s3-pii-detect-{region}-{data_catalog_table_name}"
+    create_glue_job(
+        client=GLUE_CLIENT,
+        script_location=script_location,
+        role_arn=role_arn,
+        spark_logs_path=spark_logs_path,
+        temp_dir=temp_dir,
+        bucket_name=bucket_name,
+        dc_table_name=data_catalog_table_name,
+        output_table=output_table,
+        dc_db_name=data_catalog_db_name,
+        s3_host=source_attrs["Host"]["S"],
+        region=region,
+        glue_job_name=glue_job_name
+    )
+
+    wf_name = f"s3-wf-{region}-{data_catalog_table_name}"
+    _create_if_missing(
+        GLUE_CLIENT.create_workflow,
+        Name=wf_name
     )
+    LOGGER.info(f"Successfully created glue workflow: {wf_name}")
+
+    _create_if_missing(
+        GLUE_CLIENT.create_trigger,
+        Name=f"s3-glue-trigger-{region}-{data_catalog_table_name}",
+        WorkflowName=wf_name,
+        StartOnCreation=True,
+        Type="SCHEDULED",
+        Schedule='cron(0 6 ? * MON-FRI *)',
+        Actions=[
+            {
+                "JobName": glue_job_name
+            }
+        ]
+    )
+    LOGGER.info(f"Successfully created glue trigger")
+
+    # the entry is only marked once every resource exists, a run that dies
+    # part way leaves it unmarked and the creates above are safe to repeat
+    if not update_ddb(DDB_CLIENT, ddb_table_name, {"id": s3_obj["id"]}):
+        LOGGER.warning(f"Tracker entry for {data_catalog_table_name} was already marked by another execution")
 
-    ddb_results = ddb_resp.get("Items")
+
+def lambda_handler(event, context):
+    """What executes when the program is run"""
+
+    ddb_results = _fetch_ddb_results(
+        DDB_CLIENT, 
+        DDB_PARTIQL.format(GLUE_TRACKER_DDB_TABLE_NAME),
+    )
     if not ddb_results:
         LOGGER.warning("No data sources fetched. Exiting.")
         return
 
-    pythonic_results = unmarshall_ddb_items(ddb_results)
-
-    output_table = os.environ.get(PII_OUTPUT_DDB_TABLE_NAME_ENV_VAR)
-    if not output_table:
-        raise MissingEnvironmentVariable(f"{PII_OUTPUT_DDB_TABLE_NAME_ENV_VAR} is missing")
-
-    assets_bucket = os.environ.get(GLUE_ASSETS_ENV_VAR)
-    if not assets_bucket:
-        raise MissingEnvironmentVariable(f"{GLUE_ASSETS_ENV_VAR} is missing")
-    
-    script_bucket = os.environ.get(GLUE_SCRIPT_ENV_VAR)
-    if not assets_bucket:
-        raise MissingEnvironmentVariable(f"{GLUE_SCRIPT_ENV_VAR} is missing")
-    
-    role_arn = os.environ.get(GLUE_ROLE_ARN_ENV_VAR)
-    if not role_arn:
-        raise MissingEnvironmentVariable(f"{GLUE_ROLE_ARN_ENV_VAR} is missing")
-    
-    glue_client = boto3.client("glue")
-
-    for s3_obj in pythonic_results:
-        bucket_name = s3_obj["data_source_attrs"]["bucketName"]
-        LOGGER.info(f"Attempting to create glue job for s3 source: {bucket_name}")
-        
-        data_catalog_table_name = s3_obj["data_catalog_table_name"]
-        LOGGER.info(f"Glue Data Catalog Table Name: {data_catalog_table_name}")
-        
-        data_catalog_db_name = s3_obj["data_catalog_db_name"]
-        LOGGER.info(f"Glue Data Catalog Database Name: {data_catalog_db_name}")
-        try:
-            region = s3_obj["data_source_attrs"]["CreateBucketConfiguration"]["LocationConstraint"]
-        except KeyError:
-            LOGGER.warning("'CreateBucketConfiguration' not found in data source attrs")
-            region = os.environ.get("AWS_REGION", "noregion")
-        glue_job_name = f"s3-pii-detect-{region}-{data_catalog_table_name}"
-        create_glue_job(
-            client=glue_client,
-            script_location=f"s3://{script_bucket}/{GLUE_SCRIPT_FILE_NAME}",
-            role_arn=role_arn,
-            spark_logs_path=f"s3://{assets_bucket}/sparkHistoryLogs/",
-            temp_dir=f"s3://{assets_bucket}/temporary/",
-            bucket_name=bucket_name,
-            dc_table_name=data_catalog_table_name,
-            output_table=output_table,
-            dc_db_name=data_catalog_db_name,
-            s3_host=s3_obj["data_source_attrs"]["Host"],
-            region=region,
-            glue_job_name=glue_job_name
-        )
-        
-        wf_name = f"s3-wf-{region}-{data_catalog_table_name}"
-        wf_resp = glue_client.create_workflow(
-            Name=wf_name
-        )
-        _check_missing_field(wf_resp, "ResponseMetadata")
-        _validate_field(wf_resp["ResponseMetadata"], "HTTPStatusCode", 200)
-        LOGGER.info(f"Successfully created glue workflow: {wf_name}")
-
-        trigger_resp = glue_client.create_trigger(
-            Name=f"s3-glue-trigger-{region}-{data_catalog_table_name}",
-            WorkflowName=wf_name,
-            StartOnCreation=True,
-            Type="SCHEDULED",
-            Schedule='cron(0 6 ? * MON-FRI *)',
-            Actions=[
-                {
-                    "JobName": glue_job_name
-                }
-            ]
-        )
-        _check_missing_field(trigger_resp, "ResponseMetadata")
-        _validate_field(trigger_resp["ResponseMetadata"], "HTTPStatusCode", 200)
-        LOGGER.info(f"Successfully created glue trigger")
-
-        LOGGER.info("Attempting to update glue job tracker table")
-        update_ddb(
-            client=ddb_client,
-            obj=s3_obj,
-            table_name=ddb_table_name
-            )
-
-    LOGGER.debug("Closing DynamoDB Boto3 client") 
-    ddb_client.close()
-
-    LOGGER.debug("Closing Glue boto3 client")
-    glue_client.close()
+    process_source = functools.partial(
+        _process_source,
+        ddb_table_name=GLUE_TRACKER_DDB_TABLE_NAME,
+        output_table=PII_OUTPUT_DDB_TABLE_NAME,
+        # the bucket paths are the same for every source
+        script_location=f"s3://{GLUE_SCRIPT_BUCKET}/{GLUE_SCRIPT_FILE_NAME}",
+        spark_logs_path=f"s3://{GLUE_ASSETS_BUCKET}/sparkHistoryLogs/",
+        temp_dir=f"s3://{GLUE_ASSETS_BUCKET}/temporary/",
+        role_arn=GLUE_ROLE_ARN,
+    )
+    # Glue calls are network bound, so the sources are processed concurrently
+    max_workers = min(MAX_WORKERS, len(ddb_results))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # consuming the results re-raises any exception from the workers
+        list(executor.map(process_source, ddb_results))
@@ -1,26 +1,38 @@
 import datetime
+import functools
 import logging
 import os
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 
 import boto3
-from boto3.dynamodb.types import TypeDeserializer, TypeSerializer
+from botocore.config import Config
 from botocore.exceptions import ClientError
 
 
 LOGGER = logging.getLogger()
 
-DDB_PARTIQL = "SELECT * FROM {} WHERE data_catalog_entry = True AND data_source_type = 's3'"
+DDB_PARTIQL = "SELECT data_source_attrs, data_catalog_table_name FROM {} WHERE data_catalog_entry = True AND data_source_type = 's3'"
 
 GLUE_TRACKER_DDB_TABLE_NAME_ENV_VAR = "DDB_GLUE_TRACKER_TABLE_NAME"
 DDB_TAG_TABLE_NAME_ENV_VAR = "TAG_REPORT_TABLE_NAME"
 
-REQUIRED_TAG_KEYS = ["APP_ID", "Purpose of Processing", "Data Subjects", "APP_NAME", "Business Function", "Processing Activity"]
+# upper bound on concurrent tag lookups per invocation
+MAX_WORKERS = 16
 
+REQUIRED_TAG_KEYS = frozenset({"APP_ID", "Purpose of Processing", "Data Subjects", "APP_NAME", "Business Function", "Processing Activity"})
+
+# the per-bucket tagging workers share these pooled connections
+BOTO_CONFIG = Config(
+    tcp_keepalive=True,
+    max_pool_connections=50,
+    retries={"mode": "adaptive", "max_attempts": 10},
+)
+
+DDB_CLIENT = boto3.client("dynamodb", config=BOTO_CONFIG)
+DDB_RESOURCE = boto3.resource("dynamodb", config=BOTO_CONFIG)
+S3_CLIENT = boto3.client("s3", config=BOTO_CONFIG)
 
-class MalformedEvent(Exception):
-    """Raised if a malformed event received"""
-    
 
 class MissingEnvironmentVariable(Exception):
     """Raised if a required environment variable is missing"""
@@ -50,38 +62,18 @@ def _configure_logger():
         logging.basicConfig(level=level)
 
 
-def _check_missing_field(validation_dict, extraction_key):
-    """Check if a field exists in a dictionary
+# logging and environment only need to be set up once per execution environment
+_configure_logger()
+_silence_noisy_loggers()
 
-    :param validation_dict: Dictionary
-    :param extraction_key: String
+GLUE_TRACKER_DDB_TABLE_NAME = os.environ.get(GLUE_TRACKER_DDB_TABLE_NAME_ENV_VAR)
+if not GLUE_TRACKER_DDB_TABLE_NAME:
+    raise MissingEnvironmentVariable(f"{GLUE_TRACKER_DDB_TABLE_NAME_ENV_VAR} is missing")
 
-    :raises: MalformedEvent
-    """
-    extracted_value = validation_dict.get(extraction_key)
-    
-    if not extracted_value:
-        LOGGER.error(f"Missing '{extraction_key}' field in the event")
-        raise MalformedEvent
-    
-
-def _validate_field(validation_dict, extraction_key, expected_value):
-    """Validate the passed in field
+DDB_TAG_TABLE_NAME = os.environ.get(DDB_TAG_TABLE_NAME_ENV_VAR)
+if not DDB_TAG_TABLE_NAME:
+    raise MissingEnvironmentVariable(f"{DDB_TAG_TABLE_NAME_ENV_VAR} is missing")
 
-    :param validation_dict: Dictionary
-    :param extraction_key: String
-    :param expected_value: String
-
-    :raises: ValueError
-    """
-    extracted_value = validation_dict.get(extraction_key)
-
-    _check_missing_field(validation_dict, extraction_key)
-    
-    if extracted_value != expected_value:
-        LOGGER.error(f"Incorrect value found for '{extraction_key}' field")
-        raise ValueError
-    
 
 def _fetch_ddb_results(client, query):
     """Fetch results from PartiQL DynamoDB query
@@ -91,32 +83,19 @@ def _fetch_ddb_results(client, query):
 
     :rtype: List
     """
-    resp = client.execute_statement(Statement=query)
-
-    _check_missing_field(resp, "ResponseMetadata")
+    items = []
+    statement_kwargs = {"Statement": query}
 
-    _validate_field(resp["ResponseMetadata"], "HTTPStatusCode", 200)
+    while True:
+        resp = client.execute_statement(**statement_kwargs)
 
-    return resp
+        items.extend(resp.get("Items", []))
 
-
-def unmarshall_ddb_items(ddb_items):
-    """Deserialize ddb_items
-
-    :param ddb_items: List
-
-    :rtype: List
-    """
-    unmarshalled = []
-
-    deserializer = TypeDeserializer()
-
-    for ddb_item in ddb_items:
-        unmarshalled.append(
-            {k: deserializer.deserialize(v) for k, v in ddb_item.items()}
-        )
-    
-    return unmarshalled
+        # results are paginated at 1MB
+        next_token = resp.get("NextToken")
+        if not next_token:
+            return items
+        statement_kwargs["NextToken"] = next_token
 
 
 def _get_bucket_tags(client, bucket_name):
@@ -139,16 +118,7 @@ def _get_bucket_tags(client, bucket_name):
             LOGGER.error("Unable to fetch tags for this bucket")
             raise Exception
 
-    _check_missing_field(resp, "ResponseMetadata")
-    resp_metadata = resp["ResponseMetadata"]
-
-    _check_missing_field(resp_metadata, "HTTPStatusCode")
-    status_code = resp_metadata["HTTPStatusCode"]
-    
-    if status_code == 200:
-        LOGGER.info("Successfully fetched tags for bucket")
-    else:
-        raise Exception("Request to fetch tags failed")
+    LOGGER.info("Successfully fetched tags for bucket")
     
     tag_set = resp.get("TagSet")
     if tag_set:
@@ -159,73 +129,48 @@ def _get_bucket_tags(client, bucket_name):
 
 def lambda_handler(event, context):
     """What executes when the program is run"""
-    
-    # configure python logger
-    _configure_logger()
-    # silence chatty libraries
-    _silence_noisy_loggers()
-
-    ddb_table_name = os.environ.get(GLUE_TRACKER_DDB_TABLE_NAME_ENV_VAR)
-    if not ddb_table_name:
-        raise MissingEnvironmentVariable(f"{GLUE_TRACKER_DDB_TABLE_NAME_ENV_VAR} is missing")
-    
-    tag_table_name = os.environ.get(DDB_TAG_TABLE_NAME_ENV_VAR)
-    if not tag_table_name:
-        raise MissingEnvironmentVariable(f"{DDB_TAG_TABLE_NAME_ENV_VAR} is missing")
-    
-    ddb_client = boto3.client("dynamodb")
 
-    ddb_resp = _fetch_ddb_results(
-        ddb_client, 
-        DDB_PARTIQL.format(ddb_table_name),
+    ddb_results = _fetch_ddb_results(
+        DDB_CLIENT, 
+        DDB_PARTIQL.format(GLUE_TRACKER_DDB_TABLE_NAME),
     )
-
-    ddb_results = ddb_resp.get("Items")
     if not ddb_results:
         LOGGER.warning("No data sources fetched. Exiting.")
         return
 
-    pythonic_results = unmarshall_ddb_items(ddb_results) 
+    # only a couple of string attributes are read, so the items are not unmarshalled
+    bucket_names = [item["data_source_attrs"]["M"]["bucketName"]["S"] for item in ddb_results]
+    # tag lookups are network bound, so they are fetched concurrently
+    max_workers = min(MAX_WORKERS, len(bucket_names))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        all_bucket_tags = list(executor.map(functools.partial(_get_bucket_tags, S3_CLIENT), bucket_names))
 
-    s3_client = boto3.client("s3")
-    for obj in pythonic_results:
-        bucket_name = obj["data_source_attrs"]["bucketName"]
-        LOGGER.info(f"S3 bucket name: {bucket_name}")
-        
-        bucket_tags = _get_bucket_tags(s3_client, bucket_name)
-        if not bucket_tags:
-            LOGGER.error(f"{bucket_name} does not have any tags. Skipping.")
-            continue
+    tag_table = DDB_RESOURCE.Table(DDB_TAG_TABLE_NAME)
+
+    # every row of this report run shares the same timestamp
+    time_stamp = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+    # the batch writer buffers the items into BatchWriteItem requests of up to 25
+    # and resends any unprocessed items
+    with tag_table.batch_writer() as batch:
+        for obj, bucket_name, bucket_tags in zip(ddb_results, bucket_names, all_bucket_tags):
+            LOGGER.info(f"S3 bucket name: {bucket_name}")
         
-        data_catalog_table_name = obj["data_catalog_table_name"]
-        LOGGER.info(f"Data catalog table name: {data_catalog_table_name}")
+            if not bucket_tags:
+                LOGGER.error(f"{bucket_name} does not have any tags. Skipping.")
+                continue
         
-        tag_obj = {}
+            data_catalog_table_name = obj["data_catalog_table_name"]["S"]
+            LOGGER.info(f"Data catalog table name: {data_catalog_table_name}")
         
-        for tag in bucket_tags:
-            if tag["Key"] in REQUIRED_TAG_KEYS:
-                tag_obj[tag["Key"]] = tag["Value"]
-
-        if not tag_obj:
-            LOGGER.error("None of the required tags are present. Skipping.")
-            continue
-        else:
-            LOGGER.info("Attempting to update tag reporting table")
-            tag_obj["id"] = str(uuid.uuid4())
-            tag_obj["data_catalog_table_name"] = data_catalog_table_name
-            tag_obj["time_stamp"] = datetime.datetime.strftime(datetime.datetime.now(), '%Y-%m-%d %H:%M:%S')
-            serializer = TypeSerializer()
-            resp = ddb_client.put_item(
-                TableName=tag_table_name,
-                Item={
-                    k: serializer.serialize(v) for k, v in tag_obj.items()
-                    },
-            )
-            _check_missing_field(resp, "ResponseMetadata")
-            _validate_field(resp["ResponseMetadata"], "HTTPStatusCode", 200)
-
-    LOGGER.debug("Closing S3 Boto3 client") 
-    s3_client.close()
-
-    LOGGER.debug("Closing DynamoDB Boto3 client") 
-    ddb_client.close()
+            tag_obj = {tag["Key"]: tag["Value"] for tag in bucket_tags if tag["Key"] in REQUIRED_TAG_KEYS}
+
+            if not tag_obj:
+                LOGGER.error("None of the required tags are present. Skipping.")
+                continue
+            else:
+                LOGGER.info("Queueing tag reporting table update")
+                tag_obj["id"] = str(uuid.uuid4())
+                tag_obj["data_catalog_table_name"] = data_catalog_table_name
+                tag_obj["time_stamp"] = time_stamp
+                batch.put_item(Item=tag_obj)
@@ -3,6 +3,7 @@ import logging
 import os
 
 import boto3
+from botocore.config import Config
 from botocore.exceptions import ClientError
 
 
@@ -17,6 +18,19 @@ VALID_BUCKET_TAG_VALUE = "true"
 VALID_CUSTOM_ENTITY_TAG_KEY = "glue-custom-entity"
 VALID_CUSTOM_ENTITY_TAG_VALUE = "true"
 
+# compact separators keep the message bodies free of padding whitespace
+JSON_ENCODE = json.JSONEncoder(separators=(",", ":")).encode
+
+# every record in the batch reuses these pooled S3 and SQS connections
+BOTO_CONFIG = Config(
+    tcp_keepalive=True,
+    max_pool_connections=50,
+    retries={"mode": "adaptive", "max_attempts": 10},
+)
+
+S3_CLIENT = boto3.client("s3", config=BOTO_CONFIG)
+SQS_CLIENT = boto3.client("sqs", config=BOTO_CONFIG)
+
 
 class MalformedEvent(Exception):
     """Raised if a malformed event received"""
@@ -50,6 +64,21 @@ def _configure_logger():
         logging.basicConfig(level=level)
 
 
+# logging and environment only need to be set up once per execution environment
+_configure_logger()
+_silence_noisy_loggers()
+
+GLUE_TRACK_QUEUE_URL = os.environ.get(GLUE_TRACK_QUEUE_URL_ENV_VAR)
+if not GLUE_TRACK_QUEUE_URL:
+    raise MissingEnvironmentVariable(
+        f"{GLUE_TRACK_QUEUE_URL_ENV_VAR} environment variable is required")
+
+GLUE_CUSTOM_ENTITY_QUEUE_URL = os.environ.get(GLUE_CUSTOM_ENTITY_QUEUE_URL_ENV_VAR)
+if not GLUE_CUSTOM_ENTITY_QUEUE_URL:
+    raise MissingEnvironmentVariable(
+        f"{GLUE_CUSTOM_ENTITY_QUEUE_URL_ENV_VAR} environment variable is required")
+
+
 def _check_missing_field(validation_dict, extraction_key):
     """Check if a field exists in a dictionary
 
@@ -118,24 +147,14 @@ def _send_message_to_sqs(client, queue_url, message_dict):
     :param queue_url: String
     :param message_dict: Dictionary
 
-    :raises: Exception
+    :raises: botocore.exceptions.ClientError
     """
     LOGGER.info(f"Attempting to send message to: {queue_url}")
-    resp = client.send_message(
+    client.send_message(
         QueueUrl=queue_url,
-        MessageBody=json.dumps(message_dict)
+        MessageBody=JSON_ENCODE(message_dict)
     )
-
-    _check_missing_field(resp, "ResponseMetadata")
-    resp_metadata = resp["ResponseMetadata"]
-
-    _check_missing_field(resp_metadata, "HTTPStatusCode")
-    status_code = resp_metadata["HTTPStatusCode"]
-    
-    if status_code == 200:
-        LOGGER.info("Successfully pushed message")
-    else:
-        raise Exception("Unable to push message")  
+    LOGGER.info("Successfully pushed message")
 
 
 def _get_bucket_tags(client, bucket_name):
@@ -158,16 +177,7 @@ def _get_bucket_tags(client, bucket_name):
             LOGGER.error("Unable to fetch tags for this bucket")
             raise Exception
 
-    _check_missing_field(resp, "ResponseMetadata")
-    resp_metadata = resp["ResponseMetadata"]
-
-    _check_missing_field(resp_metadata, "HTTPStatusCode")
-    status_code = resp_metadata["HTTPStatusCode"]
-    
-    if status_code == 200:
-        LOGGER.info("Successfully fetched tags for bucket")
-    else:
-        raise Exception("Request to fetch tags failed")
+    LOGGER.info("Successfully fetched tags for bucket")
     
     tag_set = resp.get("TagSet")
     if tag_set:
@@ -178,30 +188,13 @@ def _get_bucket_tags(client, bucket_name):
 
 def lambda_handler(event, context):
     """What executes when the program is run"""
-    
-    # configure python logger
-    _configure_logger()
-    # silence chatty libraries
-    _silence_noisy_loggers()
-    
+
     valid_event = _extract_valid_event(event)
     LOGGER.info("Extracted data to send to SQS")
     
-    glue_queue_url = os.environ.get(GLUE_TRACK_QUEUE_URL_ENV_VAR)
-    if not glue_queue_url:
-        raise MissingEnvironmentVariable(
-            f"{GLUE_TRACK_QUEUE_URL_ENV_VAR} environment variable is required")
-    
-    glue_custom_entity_queue_url = os.environ.get(GLUE_CUSTOM_ENTITY_QUEUE_URL_ENV_VAR)
-    if not glue_custom_entity_queue_url:
-        raise MissingEnvironmentVariable(
-            f"{GLUE_CUSTOM_ENTITY_QUEUE_URL_ENV_VAR} environment variable is required")
-    
     bucket_name = valid_event["bucketName"]
     
-    s3_client = boto3.client("s3")
-    bucket_tags = _get_bucket_tags(s3_client, bucket_name)
-    s3_client.close()
+    bucket_tags = _get_bucket_tags(S3_CLIENT, bucket_name)
 
     if not bucket_tags:
         LOGGER.warning(f"{bucket_name} does not have any tags. Exiting.")
@@ -212,20 +205,16 @@ def lambda_handler(event, context):
     message_dict["data_source_type"] = "s3"
     message_dict["data_source_attrs"] = valid_event
 
-    sqs_client = boto3.client("sqs")
-    
-    tag_match_flag = False
-    for tag in bucket_tags:
-        if tag["Key"] == VALID_BUCKET_TAG_KEY and tag["Value"] == VALID_BUCKET_TAG_VALUE:
-            tag_match_flag = True
-
-        if tag["Key"] == VALID_CUSTOM_ENTITY_TAG_KEY and tag["Value"] == VALID_CUSTOM_ENTITY_TAG_VALUE:
-            # send message to Glue custom entity initial queue
-            _send_message_to_sqs(
-                sqs_client, 
-                glue_custom_entity_queue_url, 
-                message_dict)
+    # tag keys are unique per bucket, so each flag is a single lookup
+    tag_map = {tag["Key"]: tag["Value"] for tag in bucket_tags}
+    tag_match_flag = tag_map.get(VALID_BUCKET_TAG_KEY) == VALID_BUCKET_TAG_VALUE
 
+    if tag_map.get(VALID_CUSTOM_ENTITY_TAG_KEY) == VALID_CUSTOM_ENTITY_TAG_VALUE:
+        # send message to Glue custom entity initial queue
+        _send_message_to_sqs(
+            SQS_CLIENT, 
+            GLUE_CUSTOM_ENTITY_QUEUE_URL, 
+            message_dict)
 
     if not tag_match_flag:
         LOGGER.warning(f"{bucket_name} does not have the required tag. Exiting.")
@@ -234,9 +223,8 @@ def lambda_handler(event, context):
     else:
         # send message to Glue job tracking Queue
         _send_message_to_sqs(
-            sqs_client, 
-            glue_queue_url, 
+            SQS_CLIENT, 
+            GLUE_TRACK_QUEUE_URL, 
             message_dict)
 
-    sqs_client.close()
     return
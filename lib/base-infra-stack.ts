@@ -69,6 +69,8 @@ export class BaseInfraStack extends cdk.Stack {
         partitionKey: { name: "id", type: ddb.AttributeType.STRING },
         billingMode: ddb.BillingMode.PAY_PER_REQUEST,
         encryption: ddb.TableEncryption.AWS_MANAGED,
+        // new tracker entries are pushed to the catalog creator(s) via the stream
+        stream: ddb.StreamViewType.NEW_AND_OLD_IMAGES,
       });
     this.trackerTable = table;
 
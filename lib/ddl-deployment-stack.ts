@@ -54,6 +54,10 @@ export class RdsDdlAutomationStack extends cdk.Stack {
     ddlInitDeployFn.role?.addManagedPolicy(
       iam.ManagedPolicy.fromAwsManagedPolicyName("SecretsManagerReadWrite")
     );
+    // to be able to describe cluster on RDS
+    ddlInitDeployFn.role?.addManagedPolicy(
+      iam.ManagedPolicy.fromAwsManagedPolicyName("AmazonRDSReadOnlyAccess")
+    );
 
     // lambda function to deploy DDL on RDS (when there is a change to the DDL SQL File)
     const ddlChangeFn = new lambda.Function(this, "ddlChangeFn", {
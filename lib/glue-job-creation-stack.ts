@@ -4,7 +4,7 @@ import * as ddb from 'aws-cdk-lib/aws-dynamodb';
 import * as sqs from 'aws-cdk-lib/aws-sqs';
 import * as lambda from "aws-cdk-lib/aws-lambda";
 import path = require("path");
-import { SqsEventSource } from 'aws-cdk-lib/aws-lambda-event-sources';
+import { DynamoEventSource, SqsDlq, SqsEventSource } from 'aws-cdk-lib/aws-lambda-event-sources';
 import * as s3 from 'aws-cdk-lib/aws-s3';
 import * as iam from 'aws-cdk-lib/aws-iam';
 import * as glue from "aws-cdk-lib/aws-glue";
@@ -226,6 +226,33 @@ export class GlueJobCreationStack extends cdk.Stack {
     s3GlueCatalogCreatorFn.role?.attachInlinePolicy(new iam.Policy(this, 's3CreatorGlueCatalogPolicy', {
       statements: [lambdaGlueCatalogStatement]
     }));
+    // stream batches that still fail after the retries are recorded here instead of being dropped
+    const s3GlueCatalogCreatorDlq = new sqs.Queue(this, 's3GlueCatalogCreatorDlq', {
+      retentionPeriod: cdk.Duration.days(14)
+    });
+    // trigger Lambda function only for newly tracked S3 sources without a catalog entry
+    s3GlueCatalogCreatorFn.addEventSource(new DynamoEventSource(table, {
+      startingPosition: lambda.StartingPosition.TRIM_HORIZON,
+      batchSize: 100,
+      retryAttempts: 3,
+      // split a failing batch so one bad source does not hold back the others
+      bisectBatchOnError: true,
+      onFailure: new SqsDlq(s3GlueCatalogCreatorDlq),
+      filters: [
+        lambda.FilterCriteria.filter({
+          eventName: lambda.FilterRule.isEqual('INSERT'),
+          dynamodb: {
+            NewImage: {
+              data_source_type: { S: lambda.FilterRule.isEqual('s3') },
+              // raw patterns for the boolean values
+              glue_job_created: { BOOL: [false] },
+              data_catalog_entry: { BOOL: [false] },
+            },
+          },
+        }),
+      ],
+    }));
+    // daily scan as a backstop, it picks up any source the stream invocations failed on
     const s3GlueCatalogCreatorRule = new events.Rule(this, 's3GlueCatalogCreatorRule', {
       schedule: events.Schedule.cron({
         minute: '0',
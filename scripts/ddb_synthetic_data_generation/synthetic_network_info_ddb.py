@@ -1,11 +1,14 @@
 import argparse
+import functools
 import logging
 import os
 import random
 import time
+from concurrent.futures import ThreadPoolExecutor
+from ipaddress import IPv6Address
 
 import boto3
-from boto3.dynamodb.types import TypeSerializer
+from botocore.config import Config
 from botocore.exceptions import ClientError
 from faker import Faker
 
@@ -24,37 +27,58 @@ TABLE_NAME = "NetworkInfo"
 
 MAX_RECORDS = 1000
 
+# cleared in the first octet so that the generated MAC addresses are unicast
+MAC_MULTICAST_BIT = 1 << 40
 
-def _check_missing_field(validation_dict, extraction_key):
-    """Check if a field exists in a dictionary
+# BatchWriteItem accepts at most this many put requests per call
+DDB_BATCH_MAX_ITEMS = 25
 
-    :param validation_dict: Dictionary
-    :param extraction_key: String
+# upper bound on concurrent batch writes
+MAX_WORKERS = 16
 
-    :raises: Exception
-    """
-    extracted_value = validation_dict.get(extraction_key)
-    
-    if extracted_value is None:
-        LOGGER.error(f"Missing '{extraction_key}' key in the dict")
-        raise Exception
-    
+# one pooled connection per worker, so no connection is discarded and
+# re-established mid-run; adaptive retries back off when throttled
+BOTO_CONFIG = Config(
+    tcp_keepalive=True,
+    max_pool_connections=MAX_WORKERS,
+    retries={"mode": "adaptive", "max_attempts": 10},
+)
 
-def _validate_field(validation_dict, extraction_key, expected_value):
-    """Validate the passed in field
+# backoff before resubmitting unprocessed items, doubled on every attempt
+BACKOFF_BASE_SECONDS = 0.05
+BACKOFF_CAP_SECONDS = 5
+# a batch that is still not fully written after this many calls fails the run
+BATCH_WRITE_MAX_ATTEMPTS = 10
 
-    :param validation_dict: Dictionary
-    :param extraction_key: String
-    :param expected_value: String
 
-    :raises: ValueError
+def _batch_write(client, table_name, put_requests):
+    """Write a batch of put requests, resubmitting any unprocessed items
+
+    :param client: Boto3 client object (DynamoDB)
+    :param table_name: String
+    :param put_requests: List (at most DDB_BATCH_MAX_ITEMS)
+
+    :raises: Exception
     """
-    extracted_value = validation_dict.get(extraction_key)
-    _check_missing_field(validation_dict, extraction_key)
-    
-    if extracted_value != expected_value:
-        LOGGER.error(f"Incorrect value found for '{extraction_key}' key")
-        raise ValueError
+    request_items = {table_name: put_requests}
+    for attempt in range(BATCH_WRITE_MAX_ATTEMPTS):
+        if attempt:
+            # exponential backoff with full jitter, so the workers do not
+            # resubmit in lockstep
+            time.sleep(random.uniform(
+                0, min(BACKOFF_CAP_SECONDS, BACKOFF_BASE_SECONDS * 2 ** (attempt - 1))))
+        resp = client.batch_write_item(RequestItems=request_items)
+        # throttled items come back unprocessed rather than as an error
+        request_items = resp.get("UnprocessedItems")
+        if not request_items:
+            break
+    else:
+        raise Exception(
+            f"{len(request_items[table_name])} items still unprocessed "
+            f"after {BATCH_WRITE_MAX_ATTEMPTS} attempts")
+
+    # per batch progress only shows with --verbose
+    LOGGER.debug("Inserted %d items.", len(put_requests))
 
 
 def _cli_args():
@@ -81,6 +105,10 @@ def _cli_args():
                         type=int,
                         default=MAX_RECORDS,
                         help="Maximum records to be inserted")
+    parser.add_argument("-s",
+                        "--seed",
+                        type=int,
+                        help="Seed for reproducible data generation")
     parser.add_argument("-v",
                         "--verbose",
                         action="store_true",
@@ -88,6 +116,27 @@ def _cli_args():
     return parser.parse_args()
 
 
+def _region_candidates(args):
+    """Yield the possible AWS regions in order of precedence
+
+    The candidates are only looked up once the previous ones came up empty.
+
+    :param args: argparse.Namespace
+
+    :rtype: Generator
+    """
+    # explicit cli argument
+    yield args.aws_region
+    # check if set through ENV vars
+    yield os.environ.get('AWS_REGION')
+    yield os.environ.get('AWS_DEFAULT_REGION')
+    # else check if set in config, through the default session that the
+    # client is created from anyway rather than a throwaway one
+    if not boto3.DEFAULT_SESSION:
+        boto3.setup_default_session()
+    yield boto3.DEFAULT_SESSION.region_name
+
+
 def _silence_noisy_loggers():
     """Silence chatty libraries for better logging"""
     for logger in ['boto3', 'botocore',
@@ -125,71 +174,68 @@ def main():
         LOGGER.info(f"AWS Profile being used: {args.aws_profile}")
         boto3.setup_default_session(profile_name=args.aws_profile)
 
-    region_check = [
-        # explicit cli argument
-        args.aws_region,
-        # check if set through ENV vars
-        os.environ.get('AWS_REGION'),
-        os.environ.get('AWS_DEFAULT_REGION'),
-        # else check if set in config or in boto already
-        boto3.DEFAULT_SESSION.region_name if boto3.DEFAULT_SESSION else None,
-        boto3.Session().region_name,
-    ]
-    aws_region = None
-    for aws_region in region_check:
-        if aws_region:
-            LOGGER.info(f"AWS Region: {aws_region}")
-            break
+    aws_region = next(filter(None, _region_candidates(args)), None)
     if not aws_region:
         raise Exception("Need to have a valid AWS Region")
+    LOGGER.info(f"AWS Region: {aws_region}")
 
-    ddb_client = boto3.client("dynamodb")
+    ddb_client = boto3.client("dynamodb", config=BOTO_CONFIG)
     table_name = os.environ.get(
         "NETWORK_TABLE_NAME", TABLE_NAME)
-    # Check if table exists
-    list_table_resp = ddb_client.list_tables()
-    _check_missing_field(list_table_resp, "ResponseMetadata")
-    _validate_field(
-        list_table_resp["ResponseMetadata"], 
-        "HTTPStatusCode", 
-        200)
-    _check_missing_field(list_table_resp, "TableNames")
-    
-    tables = list_table_resp["TableNames"]
-    if table_name not in tables:
-        raise Exception(f"Table {table_name} does not exist")
-
-    serializer = TypeSerializer()
+    # Check if table exists, a single lookup no matter how many tables the account has
+    try:
+        ddb_client.describe_table(TableName=table_name)
+    except ClientError as e:
+        if e.response["Error"]["Code"] == "ResourceNotFoundException":
+            raise Exception(f"Table {table_name} does not exist")
+        raise e
+
+    # all the data is generated on this thread, so seeding the shared
+    # generators makes a run reproducible
+    if args.seed is not None:
+        random.seed(args.seed)
+        Faker.seed(args.seed)
     fake = Faker()
-    # Generate and insert data into the table
-    for _ in range(MAX_RECORDS):
-        python_obj = {
-            'IP_Address_IPv4_Individually_Identifiable': fake.ipv4(),
-            'IP_Address_IPv6_Individually_Identifiable': fake.ipv6(),
-            'IP_Address_Non_Individually_Identifiable': fake.ipv4_private(),
-            'MAC_Address': fake.mac_address(),
-            'id': str(random.randint(1000000000, 9999999999))  # Random 10-digit number
-        }
+    # bound once, Faker dispatches to its providers on every attribute access
+    ipv4, ipv4_private = fake.ipv4, fake.ipv4_private
+    # the IPv6 and MAC addresses are plain random bits, so they skip Faker;
+    # the IPv4 ones stay on it to keep public and private ranges apart
+    randint, getrandbits = random.randint, random.getrandbits
+    # Generate the data up front so that it can be written in batches
+    put_requests = []
+    # the ids are deduplicated up front, since the batch writes cannot guard
+    # against a key that is already taken; a dict rather than a set keeps
+    # them in generation order, which string hashing would not across runs
+    ids = {}
+    while len(ids) < args.max_records:
+        ids[str(randint(1000000000, 9999999999))] = None  # Random 10-digit number
+    for record_id in ids:
+        # all the attributes are strings, so the items are written in the
+        # DynamoDB wire format directly
+        put_requests.append({"PutRequest": {"Item": {
+            'IP_Address_IPv4_Individually_Identifiable': {"S": ipv4()},
+            'IP_Address_IPv6_Individually_Identifiable': {"S": str(IPv6Address(getrandbits(128)))},
+            'IP_Address_Non_Individually_Identifiable': {"S": ipv4_private()},
+            'MAC_Address': {"S": (getrandbits(48) & ~MAC_MULTICAST_BIT).to_bytes(6, "big").hex(":")},
+            'id': {"S": record_id},
+        }}})
+
+    # Insert the data into the table, the writes are network bound so the
+    # batches are sent concurrently over the shared client
+    batches = [
+        put_requests[i:i + DDB_BATCH_MAX_ITEMS]
+        for i in range(0, len(put_requests), DDB_BATCH_MAX_ITEMS)
+    ]
+    write_batch = functools.partial(_batch_write, ddb_client, table_name)
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
         try:
-            resp = ddb_client.put_item(
-                TableName=table_name,
-                Item={
-                    k: serializer.serialize(v) for k, v in python_obj.items()
-                    },
-                ConditionExpression="attribute_not_exists(id)",
-            )
-            _check_missing_field(resp, "ResponseMetadata")
-            _validate_field(resp["ResponseMetadata"], "HTTPStatusCode", 200)       
-        except ClientError as e:
-            if e.response["Error"]["Code"] == "ConditionalCheckFailedException":
-                LOGGER.error(f"Primary Key violation")
-            else:
-                LOGGER.error("Unable to insert data into DynamoDB")
-                raise Exception
-
-        LOGGER.info(f"Inserted item with id: {python_obj['id']}.")
-
-    LOGGER.info(f"Data insertion complete for table: {table_name}.")
+            # consuming the results re-raises any exception from the workers
+            list(executor.map(write_batch, batches))
+        except ClientError:
+            LOGGER.error("Unable to insert data into DynamoDB")
+            raise Exception
+
+    LOGGER.info(f"Inserted {len(put_requests)} items. Data insertion complete for table: {table_name}.")
 
     ddb_client.close()
     LOGGER.info(f"Total time elapsed: {time.time() - start} seconds")